@@ -1,7 +1,9 @@
 from qgis.PyQt import QtWidgets, QtCore
-from qgis.core import QgsProject, QgsField, QgsPointXY, QgsCoordinateTransform, QgsCoordinateReferenceSystem
+from qgis.core import QgsProject, QgsField
 from qgis.utils import iface
 from PyQt5.QtCore import QVariant
+from faultlines import to_lat_lon
+from faultlines.layers import point_coordinates, write_columns
 
 class LatLonAdder(QtWidgets.QDialog):
     def __init__(self):
@@ -45,33 +47,14 @@ class LatLonAdder(QtWidgets.QDialog):
             selected_layer.dataProvider().addAttributes([QgsField('lonINTP', QVariant.Double, len=11, prec=8)])
         selected_layer.updateFields()
 
-        # Get field indices
-        lat_field_index = selected_layer.fields().indexOf('latINTP')
-        lon_field_index = selected_layer.fields().indexOf('lonINTP')
-
-        # Set up coordinate transform if needed
+        # Pull every coordinate at once and transform them in one vectorized call
+        fids, x, y = point_coordinates(selected_layer)
         source_crs = selected_layer.crs()
-        dest_crs = QgsCoordinateReferenceSystem("EPSG:4326")
-        transform = QgsCoordinateTransform(source_crs, dest_crs, QgsProject.instance())
-
-        # Start editing
-        selected_layer.startEditing()
-
-        # Update features
-        for feature in selected_layer.getFeatures():
-            point = feature.geometry().asPoint()
-            # Transform point if CRS is not already EPSG:4326
-            if source_crs != dest_crs:
-                point = transform.transform(point)
-            
-            attrs = {
-                lat_field_index: point.y(),
-                lon_field_index: point.x()
-            }
-            selected_layer.changeAttributeValues(feature.id(), attrs)
+        lat, lon = to_lat_lon(x, y, source_crs.authid() or source_crs.toWkt())
 
-        # Commit changes
-        if selected_layer.commitChanges():
+        # Write every coordinate back in a single provider transaction
+        if write_columns(selected_layer, fids, {'latINTP': lat, 'lonINTP': lon}):
+            selected_layer.triggerRepaint()
             iface.messageBar().pushSuccess("Success", "Latitude and Longitude added successfully")
         else:
             iface.messageBar().pushCritical("Error", "Failed to add Latitude and Longitude")
@@ -1,65 +1,40 @@
 from qgis.PyQt import QtWidgets, QtCore
-from qgis.core import QgsSpatialIndex, QgsFeature, QgsGeometry, QgsUnitTypes, QgsProject, QgsDistanceArea
+from qgis.core import QgsUnitTypes, QgsProject, QgsDistanceArea
 from qgis.utils import iface
+import numpy as np
+from faultlines.graph import build_adjacency_graph
+from faultlines.layers import layer_geometries, feature_values
 
 class Worker(QtCore.QObject):
     progressChanged = QtCore.pyqtSignal(int)
     selectionCompleted = QtCore.pyqtSignal(int)
     finished = QtCore.pyqtSignal()
 
-    def __init__(self, tolerance):
+    def __init__(self, tolerance, graph_path=None):
         super().__init__()
         self.tolerance = tolerance
+        self.graph_path = graph_path
         self.abort_flag = False
 
     def process(self):
         try:
             layer = iface.activeLayer()
             if layer is None:
-                self.finished.emit()
                 return
-            
-            index = QgsSpatialIndex()
-            features = list(layer.getFeatures())
-            total_features = len(features)
-
-            for i, feature in enumerate(features):
-                if self.abort_flag:
-                    self.finished.emit()
-                    return
-                index.insertFeature(feature)
-                if i % 100 == 0:
-                    self.progressChanged.emit(int((i / total_features) * 50))
-
-            adjacent_building_ids = set()
-
-            for i, feature in enumerate(features):
-                if self.abort_flag:
-                    self.finished.emit()
-                    return
-                geom = feature.geometry()
-                buffer_geom = geom.buffer(self.tolerance, 5)
-                bbox = buffer_geom.boundingBox()
-                intersecting_ids = index.intersects(bbox)
-                
-                for intersecting_id in intersecting_ids:
-                    if intersecting_id == feature.id():
-                        continue
-                    
-                    intersecting_feature = layer.getFeature(intersecting_id)
-                    intersecting_geom = intersecting_feature.geometry()
-                    
-                    if buffer_geom.intersects(intersecting_geom):
-                        adjacent_building_ids.add(feature.id())
-                        adjacent_building_ids.add(intersecting_id)
-                
-                if i % 100 == 0:
-                    self.progressChanged.emit(50 + int(((i + 1) / total_features) * 50))
 
-            if not self.abort_flag:
-                layer.selectByIds(list(adjacent_building_ids))
+            fids, geoms, features = layer_geometries(layer)
+            labels = feature_values(features, 'index') if 'index' in layer.fields().names() else fids
+            graph = build_adjacency_graph(geoms, self.tolerance, labels=labels,
+                                          progress=self.progressChanged.emit,
+                                          should_stop=lambda: self.abort_flag)
+
+            if graph is not None and not self.abort_flag:
+                if self.graph_path:
+                    graph.save(self.graph_path)
+                adjacent = np.flatnonzero(graph.degree())
+                layer.selectByIds(fids[adjacent].tolist())
                 self.progressChanged.emit(100)
-                self.selectionCompleted.emit(len(adjacent_building_ids))
+                self.selectionCompleted.emit(len(adjacent))
         finally:
             self.finished.emit()
 
@@ -117,6 +92,14 @@ class ToleranceSelector(QtWidgets.QWidget):
         self.converted_label = QtWidgets.QLabel()
         self.updateConvertedValue()
         
+        self.graph_label = QtWidgets.QLabel('Adjacency graph (.npz, optional)')
+        self.graph_input = QtWidgets.QLineEdit()
+        self.graph_button = QtWidgets.QPushButton('Browse')
+        self.graph_button.clicked.connect(self.selectGraphPath)
+        graph_layout = QtWidgets.QHBoxLayout()
+        graph_layout.addWidget(self.graph_input)
+        graph_layout.addWidget(self.graph_button)
+
         self.button = QtWidgets.QPushButton('Run')
         self.button.clicked.connect(self.runSelection)
         
@@ -127,6 +110,8 @@ class ToleranceSelector(QtWidgets.QWidget):
         layout.addWidget(self.slider)
         layout.addWidget(self.textbox)
         layout.addWidget(self.converted_label)
+        layout.addWidget(self.graph_label)
+        layout.addLayout(graph_layout)
         layout.addWidget(self.button)
         layout.addWidget(self.progressBar)
         
@@ -167,6 +152,11 @@ class ToleranceSelector(QtWidgets.QWidget):
         except ValueError:
             self.converted_label.setText("Invalid input")
         
+    def selectGraphPath(self):
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Save Adjacency Graph", "", "NumPy archive (*.npz)")
+        if path:
+            self.graph_input.setText(path)
+
     def runSelection(self):
         try:
             tolerance = float(self.textbox.text())
@@ -179,7 +169,7 @@ class ToleranceSelector(QtWidgets.QWidget):
                 self.stopWorker()
                 
                 self.thread = QtCore.QThread(self)
-                self.worker = Worker(tolerance_layer_units)
+                self.worker = Worker(tolerance_layer_units, self.graph_input.text() or None)
                 self.worker.moveToThread(self.thread)
                 self.thread.started.connect(self.worker.process)
                 self.worker.progressChanged.connect(self.progressBar.setValue)
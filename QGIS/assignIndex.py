@@ -1,7 +1,9 @@
 from qgis.PyQt import QtWidgets, QtCore
-from qgis.core import QgsSpatialIndex, QgsFeature, QgsGeometry, QgsProject, QgsField, QgsPointXY
+from qgis.core import QgsProject, QgsField
 from qgis.utils import iface
 from PyQt5.QtCore import QVariant
+from faultlines import assign_lr_index
+from faultlines.layers import layer_geometries, feature_values
 
 class Worker(QtCore.QObject):
     progressChanged = QtCore.pyqtSignal(int)
@@ -30,8 +32,6 @@ class Worker(QtCore.QObject):
             print(f"Points Layer: {points_layer_name}, Found: {points_layer is not None}")
             print(f"Buildings Layer: {buildings_layer_name}, Found: {buildings_layer is not None}")
 
-            index = QgsSpatialIndex(buildings_layer.getFeatures())
-
             if points_layer.fields().indexFromName('indexR') == -1:
                 points_layer.dataProvider().addAttributes([QgsField('indexR', QVariant.String)])
             if points_layer.fields().indexFromName('indexL') == -1:
@@ -40,50 +40,33 @@ class Worker(QtCore.QObject):
 
             print("Attributes 'indexR' and 'indexL' added to points layer.")
 
-            points_layer.startEditing()
-
-            def get_relative_position(point, building_feature):
-                centroid = building_feature.geometry().centroid().asPoint()
-                angle = QgsPointXY(point).azimuth(QgsPointXY(centroid))
-                return 'left' if 90 < angle < 270 else 'right'
-
-            total_features = points_layer.featureCount()
-            for i, point_feature in enumerate(points_layer.getFeatures()):
-                if self.abort_flag:
-                    break
-                
-                if point_feature.geometry() is None or point_feature.geometry().isEmpty():
-                    continue
-
-                point = point_feature.geometry().asPoint()
-                bbox = QgsGeometry.fromPointXY(QgsPointXY(point)).buffer(self.tolerance, 5).boundingBox()
-                intersecting_ids = index.intersects(bbox)
-
-                nearest_right = (None, float('inf'))
-                nearest_left = (None, float('inf'))
-
-                for intersecting_id in intersecting_ids:
-                    building_feature = buildings_layer.getFeature(intersecting_id)
-                    distance = point_feature.geometry().distance(building_feature.geometry())
-                    position = get_relative_position(point, building_feature)
-                    
-                    if position == 'right' and distance < nearest_right[1]:
-                        nearest_right = (building_feature['index'], distance)
-                    elif position == 'left' and distance < nearest_left[1]:
-                        nearest_left = (building_feature['index'], distance)
-
-                if nearest_right[0] is not None:
-                    points_layer.changeAttributeValue(point_feature.id(), points_layer.fields().indexFromName('indexR'), str(nearest_right[0]))
-                if nearest_left[0] is not None:
-                    points_layer.changeAttributeValue(point_feature.id(), points_layer.fields().indexFromName('indexL'), str(nearest_left[0]))
-
-                if i % 10 == 0:
-                    self.progressChanged.emit(int((i / total_features) * 100))
-
-            points_layer.commitChanges()
-            if not self.abort_flag:
-                self.indexingCompleted.emit()
-                print("Indexing completed successfully.")
+            point_fids, points, _ = layer_geometries(points_layer)
+            _, buildings, building_features = layer_geometries(buildings_layer)
+            index_left, index_right = assign_lr_index(points, buildings, feature_values(building_features, 'index'),
+                                                      tolerance=self.tolerance,
+                                                      progress=self.progressChanged.emit,
+                                                      should_stop=lambda: self.abort_flag)
+
+            if self.abort_flag:
+                return
+
+            # Write every index back in a single provider transaction
+            indexR_field = points_layer.fields().indexFromName('indexR')
+            indexL_field = points_layer.fields().indexFromName('indexL')
+            changes = {}
+            for fid, left, right in zip(point_fids.tolist(), index_left, index_right):
+                attrs = {}
+                if right is not None:
+                    attrs[indexR_field] = str(right)
+                if left is not None:
+                    attrs[indexL_field] = str(left)
+                if attrs:
+                    changes[fid] = attrs
+            points_layer.dataProvider().changeAttributeValues(changes)
+            points_layer.triggerRepaint()
+
+            self.indexingCompleted.emit()
+            print("Indexing completed successfully.")
             
         except Exception as e:
             print(f"Error during processing: {e}")
@@ -1,9 +1,14 @@
 import os
-import requests
 from qgis.PyQt import QtWidgets, QtCore
-from qgis.core import QgsProject, QgsVectorLayer, QgsField
+from qgis.core import QgsProject, QgsVectorLayer, QgsField, QgsMessageLog
 from qgis.utils import iface
 from PyQt5.QtCore import QVariant
+from faultlines import streetview
+from faultlines.download import DownloadJob, JOURNAL_NAME, download_images
+from faultlines.store import ImageStore
+from faultlines.shards import pack_folder
+from faultlines.layers import MessageBarProgress
+from faultlines.telemetry import Telemetry
 
 class StreetViewDownloader(QtWidgets.QDialog):
     def __init__(self):
@@ -63,6 +68,16 @@ class StreetViewDownloader(QtWidgets.QDialog):
         layout.addWidget(QtWidgets.QLabel('Start Index:'))
         layout.addWidget(self.start_index_input)
 
+        # Content-addressed store checkbox
+        self.store_checkbox = QtWidgets.QCheckBox('Share images across rows and folders (image store)')
+        self.store_checkbox.setChecked(False)
+        layout.addWidget(self.store_checkbox)
+
+        # Shard packing checkbox
+        self.shards_checkbox = QtWidgets.QCheckBox('Pack images into tar shards')
+        self.shards_checkbox.setChecked(False)
+        layout.addWidget(self.shards_checkbox)
+
         # Process button
         self.process_button = QtWidgets.QPushButton('Download Images')
         self.process_button.clicked.connect(self.process)
@@ -99,12 +114,13 @@ class StreetViewDownloader(QtWidgets.QDialog):
             iface.messageBar().pushWarning("Error", "Base folder path is required")
             return
 
-        self.download_street_view_images(layer, base_folder_path, api_key, size, fov, start_index)
+        self.download_street_view_images(layer, base_folder_path, api_key, size, fov, start_index,
+                                         use_store=self.store_checkbox.isChecked(),
+                                         pack_shards=self.shards_checkbox.isChecked())
 
-    def download_street_view_images(self, layer, base_folder_path, api_key, size, fov, start_index=0):
-        folder_name_split = layer.name().split('_')[0]
-        folder_name = f"{folder_name_split}_size{size}_fov{fov}"
-        folder_path = os.path.join(base_folder_path, folder_name)
+    def download_street_view_images(self, layer, base_folder_path, api_key, size, fov, start_index=0, use_store=False, pack_shards=False):
+        collection = streetview.svi_folder_name(layer.name(), size, fov)
+        folder_path = os.path.join(base_folder_path, collection)
         
         if 'filepath' not in layer.fields().names():
             layer.dataProvider().addAttributes([QgsField("filepath", QVariant.String)])
@@ -112,45 +128,64 @@ class StreetViewDownloader(QtWidgets.QDialog):
         
         os.makedirs(folder_path, exist_ok=True)
         
-        layer.startEditing()
+        telemetry = Telemetry('downloadSVI')
+        with telemetry.stage('read'):
+            features = list(layer.getFeatures())[start_index:]
+            telemetry.count('features_processed', len(features))
         
-        count = 0
-        total_features = layer.featureCount()
-        for feature in layer.getFeatures():
-            if count < start_index:
-                count += 1
-                continue
-            
-            rowId = feature['rowId']
-            panoId = feature['panoId']
-            latINTP = feature['latINTP']
-            lonINTP = feature['lonINTP']
-            indexL = feature['indexL']
-            indexR = feature['indexR']
-            heading = feature['heading']
-            pitch = feature['pitch']
-            
-            file_name = f"SVI-{rowId}-{panoId}-{latINTP}-{lonINTP}-{indexL}-{indexR}.jpg"
-            file_path = os.path.join(folder_path, file_name)
-            
-            url = f"https://maps.googleapis.com/maps/api/streetview?&pano={panoId}&size={size}&fov={fov}&heading={heading}&pitch={pitch}&key={api_key}"
-            response = requests.get(url)
-            
-            if response.status_code == 200:
-                with open(file_path, 'wb') as file:
-                    file.write(response.content)
-                
-                feature.setAttribute(feature.fieldNameIndex('filepath'), file_path)
-                layer.updateFeature(feature)
+        progress = MessageBarProgress(iface.messageBar(), "Progress", "Downloaded images")
+        with streetview.StreetViewClient(api_key, telemetry=telemetry) as client, telemetry.stage('download'):
+            if use_store:
+                # Identical pano/heading/pitch/fov/size requests are fetched once and hard linked into the folder
+                fields = ['rowId', 'panoId', 'latINTP', 'lonINTP', 'indexL', 'indexR', 'heading', 'pitch']
+                rows = [{name: feature[name] for name in fields} for feature in features]
+                with ImageStore(os.path.join(base_folder_path, 'store')) as store:
+                    store.fetch(client, collection, rows, size, fov, progress=progress)
+                    linked = store.materialize(collection, folder_path)
+                paths = [linked.get(str(feature['rowId'])) for feature in features]
             else:
-                iface.messageBar().pushWarning("API Error", f"Couldn't get the SVI for feature {rowId}")
-            
-            count += 1
-            # Update progress
-            progress = int((count / total_features) * 100)
-            iface.messageBar().pushInfo("Progress", f"Downloaded {count} of {total_features} images ({progress}%)")
+                jobs = []
+                for feature in features:
+                    rowId = feature['rowId']
+                    panoId = feature['panoId']
+                    latINTP = feature['latINTP']
+                    lonINTP = feature['lonINTP']
+                    indexL = feature['indexL']
+                    indexR = feature['indexR']
+                    heading = feature['heading']
+                    pitch = feature['pitch']
+
+                    file_name = streetview.svi_file_name(rowId, panoId, latINTP, lonINTP, indexL, indexR)
+                    file_path = os.path.join(folder_path, file_name)
+                    jobs.append(DownloadJob(rowId, client.image_url(panoId, size, fov, heading, pitch), file_path))
+
+                # Already downloaded images are skipped and interrupted runs resume from the journal
+                paths = download_images(client, jobs, journal_path=os.path.join(folder_path, JOURNAL_NAME),
+                                        progress=progress)
+        progress.close()
+        
+        with telemetry.stage('write'):
+            filepath_index = layer.fields().indexOf('filepath')
+            changes = {}
+            failed = []
+            for feature, path in zip(features, paths):
+                if path is None:
+                    failed.append(feature['rowId'])
+                    continue
+                changes[feature.id()] = {filepath_index: path}
+            layer.dataProvider().changeAttributeValues(changes)
+            telemetry.count('missing_images', len(failed))
+        if failed:
+            iface.messageBar().pushWarning("API Error", f"Couldn't get the SVI for {len(failed)} features (first: {failed[0]})")
+
+        if pack_shards:
+            with telemetry.stage('pack'):
+                count = pack_folder(folder_path, os.path.join(folder_path, 'shards', collection))
+                telemetry.count('images_packed', count)
+            iface.messageBar().pushInfo("Shards", f"Packed {count} images into {os.path.join(folder_path, 'shards')}")
         
-        layer.commitChanges()
+        QgsMessageLog.logMessage(telemetry.summary(), 'FaultLines')
+        telemetry.save()
         iface.messageBar().pushSuccess("Success", "Street View images downloaded successfully")
         self.close()
 
@@ -1,10 +1,13 @@
 from qgis.PyQt import QtWidgets, QtCore
 from qgis.core import (QgsProject, QgsVectorLayer, QgsField, QgsFeature, 
                        QgsGeometry, QgsPointXY, QgsCategorizedSymbolRenderer,
-                       QgsRendererCategory, QgsMarkerSymbol, QgsWkbTypes)
+                       QgsRendererCategory, QgsMarkerSymbol, QgsWkbTypes, QgsMessageLog)
 from qgis.utils import iface
 from PyQt5.QtCore import QVariant
-import requests
+from faultlines import streetview
+from faultlines.cache import MetadataCache
+from faultlines.layers import MessageBarProgress
+from faultlines.telemetry import Telemetry
 
 class NearestStreetViewLocator(QtWidgets.QDialog):
     def __init__(self):
@@ -67,51 +70,76 @@ class NearestStreetViewLocator(QtWidgets.QDialog):
         ])
         sv_layer.updateFields()
 
-        # Process each feature in the input layer
-        total_features = layer.featureCount()
-        for count, feature in enumerate(layer.getFeatures()):
-            if feature.geometry() is None or feature.geometry().isNull():
-                iface.messageBar().pushWarning("Null Geometry", f"Feature ID {feature.id()} has a null geometry. Skipping.")
-                continue
-
-            try:
-                # Get the point coordinates
-                point = feature.geometry().asPoint()
-                
-                # Query the Street View API
-                url = f"https://maps.googleapis.com/maps/api/streetview/metadata?location={point.y()},{point.x()}&key={api_key}"
-                response = requests.get(url)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    status = data.get('status')
-
-                    if status == 'OK':
-                        # Create a new feature for the Street View location
+        telemetry = Telemetry('getNearestSVIFL')
+
+        # Collect the points to query
+        with telemetry.stage('read'):
+            features = []
+            skipped = 0
+            for feature in layer.getFeatures():
+                if feature.geometry() is None or feature.geometry().isNull():
+                    skipped += 1
+                    continue
+                features.append(feature)
+            points = [feature.geometry().asPoint() for feature in features]
+            telemetry.count('features_processed', len(features))
+            telemetry.count('null_geometries', skipped)
+        if skipped:
+            iface.messageBar().pushWarning("Null Geometry", f"Skipped {skipped} features with a null geometry.")
+
+        # Query the Street View API for all points over one pooled client
+        query_progress = MessageBarProgress(iface.messageBar(), "Progress", "Queried points", cancellable=True)
+        with telemetry.stage('query'), MetadataCache() as cache, \
+                streetview.StreetViewClient(api_key, cache=cache, telemetry=telemetry) as client:
+            results = client.nearest_panos([(point.y(), point.x()) for point in points],
+                                           progress=query_progress, should_stop=query_progress.should_stop)
+        query_progress.close()
+        if query_progress.cancelled:
+            QgsMessageLog.logMessage(telemetry.summary(), 'FaultLines')
+            telemetry.save()
+            iface.messageBar().pushWarning("Cancelled", "Street View lookup cancelled; no layer was added")
+            return
+
+        # Build every output feature, then add them in one call
+        with telemetry.stage('write'):
+            progress = MessageBarProgress(iface.messageBar(), "Progress", "Processed points")
+            sv_features = []
+            failed = []
+            total_features = len(features)
+            for count, (feature, point, data) in enumerate(zip(features, points, results)):
+                try:
+                    if data is not None:
+                        status = data.get('status')
+
                         sv_feat = QgsFeature()
-                        sv_feat.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(float(data['location']['lng']), float(data['location']['lat']))))
-                        sv_feat.setAttributes([
-                            feature.id(),
-                            data['pano_id'],
-                            float(data['location']['lat']),
-                            float(data['location']['lng']),
-                            status
-                        ])
-                        sv_provider.addFeature(sv_feat)
+                        if status == 'OK':
+                            # Create a new feature for the Street View location
+                            sv_feat.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(float(data['location']['lng']), float(data['location']['lat']))))
+                            sv_feat.setAttributes([
+                                feature.id(),
+                                data['pano_id'],
+                                float(data['location']['lat']),
+                                float(data['location']['lng']),
+                                status
+                            ])
+                        else:
+                            # Add a feature at the original location with status
+                            sv_feat.setGeometry(QgsGeometry.fromPointXY(point))
+                            sv_feat.setAttributes([feature.id(), '', point.y(), point.x(), status])
+                        sv_features.append(sv_feat)
                     else:
-                        # Add a feature at the original location with status
-                        sv_feat = QgsFeature()
-                        sv_feat.setGeometry(QgsGeometry.fromPointXY(point))
-                        sv_feat.setAttributes([feature.id(), '', point.y(), point.x(), status])
-                        sv_provider.addFeature(sv_feat)
-                else:
-                    iface.messageBar().pushWarning("API Error", f"Failed to query API for feature {feature.id()}")
-            except Exception as e:
-                iface.messageBar().pushWarning("Processing Error", f"Error processing feature {feature.id()}: {str(e)}")
-
-            # Update progress
-            progress = int((count + 1) / total_features * 100)
-            iface.messageBar().pushInfo("Progress", f"Processed {count + 1} of {total_features} points ({progress}%)")
+                        failed.append(feature.id())
+                except Exception as e:
+                    failed.append(feature.id())
+                    QgsMessageLog.logMessage(f"Error processing feature {feature.id()}: {str(e)}", 'FaultLines')
+                progress(count + 1, total_features)
+            sv_provider.addFeatures(sv_features)
+            sv_layer.updateExtents()
+            progress.close()
+            telemetry.count('api_failures', len(failed))
+
+        if failed:
+            iface.messageBar().pushWarning("API Error", f"Failed to query API for {len(failed)} features (first: {failed[0]})")
 
         # Add the layer to the map
         QgsProject.instance().addMapLayer(sv_layer)
@@ -119,6 +147,8 @@ class NearestStreetViewLocator(QtWidgets.QDialog):
         # Style the layer
         self.style_layer(sv_layer)
 
+        QgsMessageLog.logMessage(telemetry.summary(), 'FaultLines')
+        telemetry.save()
         iface.messageBar().pushSuccess("Success", "Nearest Street View locations added to the map")
         self.close()
 
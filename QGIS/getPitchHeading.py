@@ -1,8 +1,11 @@
 from qgis.PyQt import QtWidgets, QtCore
-from qgis.core import QgsProject, QgsVectorLayer, QgsFeature, QgsGeometry, QgsPointXY, QgsField, QgsLineSymbol, QgsArrowSymbolLayer
+from qgis.core import (QgsProject, QgsMapLayer, QgsVectorLayer, QgsField, QgsFields, QgsLineSymbol, QgsArrowSymbolLayer,
+                       QgsCoordinateReferenceSystem, QgsVectorFileWriter, QgsWkbTypes, QgsMessageLog)
 from qgis.utils import iface
 from PyQt5.QtCore import QVariant
-from math import atan2, degrees
+from faultlines import heading_pitch
+from faultlines.layers import add_features, line_features, numeric_columns, raster_values, write_columns
+from faultlines.telemetry import Telemetry
 
 class PitchHeadingCalculator(QtWidgets.QDialog):
     def __init__(self):
@@ -19,11 +22,26 @@ class PitchHeadingCalculator(QtWidgets.QDialog):
         layout.addWidget(QtWidgets.QLabel('Select Layer:'))
         layout.addWidget(self.layer_combo)
 
+        # Optional pitch sources
+        self.height_combo = QtWidgets.QComboBox()
+        self.layer_combo.currentIndexChanged.connect(self.populateHeightCombo)
+        self.populateHeightCombo()
+        layout.addWidget(QtWidgets.QLabel('Target Height Field (optional):'))
+        layout.addWidget(self.height_combo)
+
+        self.dem_combo = QtWidgets.QComboBox()
+        self.populateDemCombo()
+        layout.addWidget(QtWidgets.QLabel('DEM Layer (optional):'))
+        layout.addWidget(self.dem_combo)
+
         # Draw lines checkbox
         self.draw_lines_checkbox = QtWidgets.QCheckBox('Draw Lines')
         self.draw_lines_checkbox.setChecked(True)
         layout.addWidget(self.draw_lines_checkbox)
 
+        self.gpkg_checkbox = QtWidgets.QCheckBox('Write Lines to GeoPackage')
+        layout.addWidget(self.gpkg_checkbox)
+
         # Process button
         self.process_button = QtWidgets.QPushButton('Calculate Pitch and Heading')
         self.process_button.clicked.connect(self.process)
@@ -37,15 +55,35 @@ class PitchHeadingCalculator(QtWidgets.QDialog):
             if layer.type() == QgsVectorLayer.VectorLayer:
                 self.layer_combo.addItem(layer.name(), layer)
 
+    def populateHeightCombo(self):
+        self.height_combo.clear()
+        self.height_combo.addItem('None', None)
+        layer = self.layer_combo.currentData()
+        if layer:
+            for field in layer.fields():
+                if field.isNumeric():
+                    self.height_combo.addItem(field.name(), field.name())
+
+    def populateDemCombo(self):
+        self.dem_combo.clear()
+        self.dem_combo.addItem('None', None)
+        for layer in QgsProject.instance().mapLayers().values():
+            if layer.type() == QgsMapLayer.RasterLayer:
+                self.dem_combo.addItem(layer.name(), layer)
+
     def process(self):
         layer = self.layer_combo.currentData()
         if not layer:
             iface.messageBar().pushWarning("Error", "No layer selected")
             return
 
+        self.telemetry = Telemetry('getPitchHeading')
         self.calculate_pitch_heading(layer)
         if self.draw_lines_checkbox.isChecked():
-            self.draw_lines(layer)
+            with self.telemetry.stage('draw'):
+                self.draw_lines(layer)
+        QgsMessageLog.logMessage(self.telemetry.summary(), 'FaultLines')
+        self.telemetry.save()
 
     def calculate_pitch_heading(self, layer):
         if 'pitch' not in layer.fields().names():
@@ -54,54 +92,72 @@ class PitchHeadingCalculator(QtWidgets.QDialog):
             layer.dataProvider().addAttributes([QgsField("heading", QVariant.Double)])
         layer.updateFields()
 
-        pitch_heading_dict = {}
-        total_features = layer.featureCount()
-        for count, feature in enumerate(layer.getFeatures()):
-            latINTP = feature['latINTP']
-            lonINTP = feature['lonINTP']
-            latSVI = feature['latSVI']
-            lonSVI = feature['lonSVI']
-            panoId = feature['panoId']
-            dx = lonINTP - lonSVI
-            dy = latINTP - latSVI
-            heading = degrees(atan2(dx, dy))
-            pitch = 0  # Assuming a flat surface, set pitch to 0
-            pitch_heading_dict[panoId] = (pitch, heading)
-            
-            progress = int((count + 1) / total_features * 100)
-            iface.messageBar().pushInfo("Progress", f"Calculated {count + 1} of {total_features} features ({progress}%)")
-
-        layer.startEditing()
-        for feature in layer.getFeatures():
-            panoId = feature['panoId']
-            if panoId in pitch_heading_dict:
-                pitch, heading = pitch_heading_dict[panoId]
-                feature.setAttribute(feature.fieldNameIndex('pitch'), pitch)
-                feature.setAttribute(feature.fieldNameIndex('heading'), heading)
-                layer.updateFeature(feature)
-        layer.commitChanges()
-        
-        iface.messageBar().pushSuccess("Success", "Pitch and heading calculated successfully")
+        telemetry = self.telemetry
+
+        # Read the coordinate columns once, keyed by feature ID
+        height_field = self.height_combo.currentData()
+        names = ['latINTP', 'lonINTP', 'latSVI', 'lonSVI'] + ([height_field] if height_field else [])
+        with telemetry.stage('read'):
+            fids, columns = numeric_columns(layer, names)
+            telemetry.count('features_processed', len(fids))
+
+        # Terrain elevation under the target and the camera, when a DEM is given
+        dem = self.dem_combo.currentData()
+        target_elevation = camera_elevation = None
+        if dem:
+            with telemetry.stage('dem'):
+                target_elevation = raster_values(dem, columns['latINTP'], columns['lonINTP'])
+                camera_elevation = raster_values(dem, columns['latSVI'], columns['lonSVI'])
+                telemetry.count('dem_samples', 2 * len(fids))
+
+        with telemetry.stage('compute'):
+            heading, pitch = heading_pitch(columns['latINTP'], columns['lonINTP'], columns['latSVI'], columns['lonSVI'],
+                                           target_height=columns[height_field] if height_field else None,
+                                           target_elevation=target_elevation, camera_elevation=camera_elevation)
+            telemetry.count('geometry_ops', len(fids))
+
+        # Write every row back in a single provider transaction
+        with telemetry.stage('write'):
+            written = write_columns(layer, fids, {'pitch': pitch, 'heading': heading})
+        if written:
+            layer.triggerRepaint()
+            iface.messageBar().pushSuccess("Success", "Pitch and heading calculated successfully")
+        else:
+            iface.messageBar().pushCritical("Error", "Failed to write pitch and heading")
 
     def draw_lines(self, layer):
-        line_layer = QgsVectorLayer("LineString?crs=EPSG:4326", f"{layer.name()}_Arrows", "memory")
-        line_layer.dataProvider().addAttributes([QgsField("panoId", QVariant.String)])
-        line_layer.updateFields()
-
-        total_features = layer.featureCount()
-        for count, feature in enumerate(layer.getFeatures()):
-            latINTP = feature['latINTP']
-            lonINTP = feature['lonINTP']
-            latSVI = feature['latSVI']
-            lonSVI = feature['lonSVI']
-            panoId = feature['panoId']
-            line_feature = QgsFeature()
-            line_feature.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(lonSVI, latSVI), QgsPointXY(lonINTP, latINTP)]))
-            line_feature.setAttributes([panoId])
-            line_layer.dataProvider().addFeature(line_feature)
-            
-            progress = int((count + 1) / total_features * 100)
-            iface.messageBar().pushInfo("Progress", f"Drew {count + 1} of {total_features} lines ({progress}%)")
+        fields = QgsFields()
+        fields.append(QgsField("panoId", QVariant.String))
+        crs = QgsCoordinateReferenceSystem("EPSG:4326")
+        name = f"{layer.name()}_Arrows"
+
+        # Build every view ray from the coordinate columns at once
+        _, columns = numeric_columns(layer, ['latINTP', 'lonINTP', 'latSVI', 'lonSVI'], text=['panoId'])
+        features = line_features(fields, columns['lonSVI'], columns['latSVI'], columns['lonINTP'], columns['latINTP'],
+                                 {'panoId': columns['panoId']})
+
+        if self.gpkg_checkbox.isChecked():
+            path, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Save Arrows', f"{name}.gpkg", 'GeoPackage (*.gpkg)')
+            if not path:
+                return
+            options = QgsVectorFileWriter.SaveVectorOptions()
+            options.driverName = "GPKG"
+            options.layerName = name
+            writer = QgsVectorFileWriter.create(path, fields, QgsWkbTypes.LineString, crs,
+                                                QgsProject.instance().transformContext(), options)
+            if writer.hasError() != QgsVectorFileWriter.NoError:
+                iface.messageBar().pushCritical("Error", writer.errorMessage())
+                return
+            count = add_features(writer, features)
+            del writer  # flushes and closes the GeoPackage
+            line_layer = QgsVectorLayer(f"{path}|layername={name}", name, "ogr")
+        else:
+            line_layer = QgsVectorLayer("LineString?crs=EPSG:4326", name, "memory")
+            line_layer.dataProvider().addAttributes(fields.toList())
+            line_layer.updateFields()
+            count = add_features(line_layer.dataProvider(), features)
+            line_layer.updateExtents()
+        self.telemetry.count('lines_drawn', count)
 
         line_symbol = QgsLineSymbol()
         arrow_symbol_layer = QgsArrowSymbolLayer()
@@ -113,7 +169,7 @@ class PitchHeadingCalculator(QtWidgets.QDialog):
         line_layer.renderer().setSymbol(line_symbol)
         QgsProject.instance().addMapLayer(line_layer)
         
-        iface.messageBar().pushSuccess("Success", "Arrow lines drawn successfully")
+        iface.messageBar().pushSuccess("Success", f"{count} arrow lines drawn successfully")
 
 def run_pitch_heading_calculator():
     dialog = PitchHeadingCalculator()
@@ -1,8 +1,10 @@
 from qgis.PyQt import QtWidgets, QtCore
-from qgis.core import QgsProject, QgsVectorLayer, QgsFeature, QgsGeometry, QgsPointXY
+from qgis.core import QgsProject, QgsVectorLayer, QgsFeature, QgsGeometry, QgsPointXY, QgsMessageLog
 from qgis.utils import iface
-from PyQt5.QtCore import QVariant
-import requests
+from faultlines import streetview
+from faultlines.cache import MetadataCache
+from faultlines.layers import MessageBarProgress
+from faultlines.telemetry import Telemetry
 
 class StreetViewPanoramaLocator(QtWidgets.QDialog):
     def __init__(self):
@@ -50,71 +52,61 @@ class StreetViewPanoramaLocator(QtWidgets.QDialog):
 
         self.main(api_key, layer)
 
-    def get_session_token(self, api_key):
-        url = "https://tile.googleapis.com/v1/createSession?key=" + api_key
-        headers = {'Content-Type': 'application/json'}
-        payload = {
-            "mapType": "streetview",
-            "language": "en-US",
-            "region": "US"
-        }
-        response = requests.post(url, json=payload, headers=headers)
-        if response.status_code == 200:
-            iface.messageBar().pushInfo("Success", "Session token obtained")
-            return response.json().get('session')
-        else:
-            iface.messageBar().pushCritical("Error", f"Error getting session token: {response.status_code} {response.text}")
-            return None
-
-    def get_pano_location(self, api_key, pano_id):
-        url = f"https://maps.googleapis.com/maps/api/streetview/metadata?pano={pano_id}&key={api_key}"
-        headers = {'Content-Type': 'application/json'}
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            data = response.json()
-            lat = data.get('location', {}).get('lat')
-            lng = data.get('location', {}).get('lng')
-            return lat, lng
-        else:
-            iface.messageBar().pushWarning("API Error", f"Error retrieving pano location for panoID: {pano_id}")
-            return None, None
-
-    def get_panorama_ids(self, session_token, api_key, lat, lng, new_layer, indexL, indexR):
-        url = f"https://tile.googleapis.com/v1/streetview/panoIds?session={session_token}&key={api_key}"
-        headers = {'Content-Type': 'application/json'}
-        payload = {"locations": [{"lat": lat, "lng": lng}], "radius": 50}
-        response = requests.post(url, json=payload, headers=headers)
-        pano_ids = response.json().get('panoIds', [])
-        if response.status_code == 200:
-            for pano_id in pano_ids:
-                latSVI, lonSVI = self.get_pano_location(api_key, pano_id)
-                if latSVI is not None and lonSVI is not None:
-                    feat = QgsFeature()
-                    feat.setAttributes([pano_id, lat, lng, latSVI, lonSVI, indexL, indexR])
-                    feat.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(float(lonSVI), float(latSVI))))
-                    new_layer.dataProvider().addFeature(feat)
+    def get_panorama_ids(self, client, rows, new_layer, telemetry):
+        # Pano IDs for every point are collected first so each panorama is located only once
+        progress = MessageBarProgress(iface.messageBar(), "Progress", "Located", cancellable=True)
+        with telemetry.stage('query'):
+            results = client.panoramas_near([(lat, lng) for lat, lng, _, _ in rows],
+                                            progress=progress, should_stop=progress.should_stop)
+            telemetry.count('features_processed', len(rows))
+        progress.close()
+        if progress.cancelled:
+            return False
+        features = []
+        failed = []
+        for (lat, lng, indexL, indexR), panoramas in zip(rows, results):
+            if panoramas is None:
+                failed.append((lat, lng))
+                continue
+            for pano_id, latSVI, lonSVI in panoramas:
+                feat = QgsFeature()
+                feat.setAttributes([pano_id, lat, lng, latSVI, lonSVI, indexL, indexR])
+                feat.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(float(lonSVI), float(latSVI))))
+                features.append(feat)
+        with telemetry.stage('write'):
+            new_layer.dataProvider().addFeatures(features)
             new_layer.updateExtents()
-        else:
-            iface.messageBar().pushWarning("API Error", f"Error getting panorama IDs: {response.status_code} {response.text}")
+            telemetry.count('panoramas', len(features))
+        telemetry.count('api_failures', len(failed), stage='query')
+        if failed:
+            iface.messageBar().pushWarning("API Error", f"Error getting panorama IDs for {len(failed)} points (first: {failed[0][0]}, {failed[0][1]})")
+        return True
 
     def main(self, api_key, layer):
         new_layer = QgsVectorLayer("Point?crs=EPSG:4326&field=panoId:string&field=latINTP:double(20,14)&field=lonINTP:double(20,14)&field=latSVI:double(20,14)&field=lonSVI:double(20,14)&field=indexL:string&field=indexR:string", f"{layer.name()}_SVI", "memory")
-        session_token = self.get_session_token(api_key)
-        if not session_token:
+        telemetry = Telemetry('nearestSVI')
+        cache = MetadataCache()
+        client = streetview.StreetViewClient(api_key, cache=cache, telemetry=telemetry)
+        with telemetry.stage('session'):
+            token = client.get_session_token()
+        if not token:
+            client.close()
+            cache.close()
             iface.messageBar().pushCritical("Error", "Session token not available, aborting.")
             return
-
-        total_features = layer.featureCount()
-        for count, feature in enumerate(layer.getFeatures()):
-            indexL = feature['indexL']
-            indexR = feature['indexR']
-            latINTP = feature['latINTP']
-            lonINTP = feature['lonINTP']
-            self.get_panorama_ids(session_token, api_key, latINTP, lonINTP, new_layer, indexL, indexR)
-            
-            # Update progress
-            progress = int((count + 1) / total_features * 100)
-            iface.messageBar().pushInfo("Progress", f"Processed {count + 1} of {total_features} points ({progress}%)")
+        iface.messageBar().pushInfo("Success", "Session token obtained")
+
+        with telemetry.stage('read'):
+            rows = [(feature['latINTP'], feature['lonINTP'], feature['indexL'], feature['indexR'])
+                    for feature in layer.getFeatures()]
+        with cache, client:
+            finished = self.get_panorama_ids(client, rows, new_layer, telemetry)
+        QgsMessageLog.logMessage(telemetry.summary(), 'FaultLines')
+        telemetry.save()
+        if not finished:
+            iface.messageBar().pushWarning("Cancelled", "Panorama lookup cancelled; no layer was added")
+            return
+        iface.messageBar().pushInfo("Progress", f"Processed {len(rows)} points")
 
         if new_layer.featureCount() > 0:
             QgsProject.instance().addMapLayer(new_layer)
@@ -0,0 +1,92 @@
+from qgis.PyQt import QtWidgets
+from qgis.core import QgsProject, QgsVectorLayer, QgsFeature, QgsGeometry, QgsWkbTypes
+from qgis.utils import iface
+from faultlines.walls import party_wall_points
+from faultlines.layers import layer_geometries, feature_values
+
+class PartyWallExtractor(QtWidgets.QDialog):
+    def __init__(self):
+        super().__init__()
+        self.initUI()
+
+    def initUI(self):
+        self.setWindowTitle('FaultLines - Party Walls')
+        layout = QtWidgets.QVBoxLayout()
+
+        # Buildings layer selection
+        self.buildings_combo = QtWidgets.QComboBox()
+        layout.addWidget(QtWidgets.QLabel('Select Buildings Layer:'))
+        layout.addWidget(self.buildings_combo)
+
+        # Optional streets layer selection
+        self.streets_combo = QtWidgets.QComboBox()
+        layout.addWidget(QtWidgets.QLabel('Select Streets Layer (optional):'))
+        layout.addWidget(self.streets_combo)
+        self.populateLayerCombos()
+
+        # Tolerance input
+        self.tolerance_input = QtWidgets.QDoubleSpinBox()
+        self.tolerance_input.setDecimals(4)
+        self.tolerance_input.setRange(0, 100)
+        self.tolerance_input.setValue(0.01)
+        layout.addWidget(QtWidgets.QLabel('Tolerance (layer units):'))
+        layout.addWidget(self.tolerance_input)
+
+        # Process button
+        self.process_button = QtWidgets.QPushButton('Extract Party Walls')
+        self.process_button.clicked.connect(self.process)
+        layout.addWidget(self.process_button)
+
+        self.setLayout(layout)
+
+    def populateLayerCombos(self):
+        self.buildings_combo.clear()
+        self.streets_combo.clear()
+        self.streets_combo.addItem('None', None)
+        for layer in QgsProject.instance().mapLayers().values():
+            if layer.type() != QgsVectorLayer.VectorLayer:
+                continue
+            if layer.geometryType() == QgsWkbTypes.PolygonGeometry:
+                self.buildings_combo.addItem(layer.name(), layer)
+            elif layer.geometryType() == QgsWkbTypes.LineGeometry:
+                self.streets_combo.addItem(layer.name(), layer)
+
+    def process(self):
+        buildings_layer = self.buildings_combo.currentData()
+        streets_layer = self.streets_combo.currentData()
+        if not buildings_layer:
+            iface.messageBar().pushWarning("Error", "No buildings layer selected")
+            return
+
+        _, buildings, building_features = layer_geometries(buildings_layer)
+        streets = layer_geometries(streets_layer)[1] if streets_layer else None
+        if 'index' in buildings_layer.fields().names():
+            labels = feature_values(building_features, 'index')
+        else:
+            labels = [feature.id() for feature in building_features]
+
+        walls = party_wall_points(buildings, self.tolerance_input.value(), streets=streets)
+
+        block_id = buildings_layer.name().split('_')[-1]
+        points_layer = QgsVectorLayer(f"Point?crs={buildings_layer.crs().authid()}&field=buildingA:string&field=buildingB:string&field=end:integer&field=length:double",
+                                      f"10_{block_id}_Vertices_Intersections", "memory")
+        features = []
+        for point, left, right, end, length in zip(walls['points'], walls['left'], walls['right'], walls['end'], walls['length']):
+            feat = QgsFeature()
+            feat.setGeometry(QgsGeometry.fromWkt(point.wkt))
+            feat.setAttributes([str(labels[left]), str(labels[right]), int(end), float(length)])
+            features.append(feat)
+        points_layer.dataProvider().addFeatures(features)
+        points_layer.updateExtents()
+
+        QgsProject.instance().addMapLayer(points_layer)
+        iface.messageBar().pushSuccess("Success", f"Extracted {len(features)} party wall points")
+        self.close()
+
+def run_party_wall_extractor():
+    dialog = PartyWallExtractor()
+    dialog.show()
+    return dialog
+
+# Run the tool
+party_wall_dialog = run_party_wall_extractor()
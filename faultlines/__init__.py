@@ -0,0 +1,90 @@
+"""FaultLines core library.
+
+Headless implementations of the adjacency -> index -> SVI pipeline. Every
+stage works on Shapely geometry arrays and NumPy columns so it can run on a
+server without QGIS; the scripts in ``QGIS/`` are thin wrappers over it.
+"""
+
+from .adjacency import adjacency_pairs, find_adjacent_buildings
+from .cache import MetadataCache
+from .depthmaps import DepthReader, DepthWriter
+from .download import DownloadJob, download_images
+from .graph import AdjacencyGraph, build_adjacency_graph, load_graph
+from .indexing import assign_lr_index, label_sides, label_sides_file, side_labels
+from .masks import MaskTable, load_masks, mask_table, rle_area, rle_decode, rle_encode
+from .geo import from_lat_lon, heading_pitch, to_lat_lon
+from .shards import ShardReader, ShardWriter, pack_folder
+from .store import ImageStore, blob_key
+from .tiling import tiled_adjacency_graph, tiled_adjacency_pairs, tiled_assign_lr_index
+from .walls import party_wall_points, party_walls, shared_walls, wall_endpoints
+from .tables import TableWriter, convert_table, iter_table, read_table, write_table
+from .telemetry import Telemetry, Throttle
+from .streetview import (
+    RateLimiter,
+    StreetViewClient,
+    get_session_token,
+    get_pano_location,
+    get_panorama_ids,
+    get_nearest_pano,
+    image_url,
+    parse_svi_file_name,
+    svi_file_name,
+    svi_folder_name,
+    download_image,
+)
+
+__all__ = [
+    "adjacency_pairs",
+    "find_adjacent_buildings",
+    "AdjacencyGraph",
+    "build_adjacency_graph",
+    "load_graph",
+    "assign_lr_index",
+    "side_labels",
+    "label_sides",
+    "label_sides_file",
+    "tiled_adjacency_pairs",
+    "tiled_adjacency_graph",
+    "tiled_assign_lr_index",
+    "party_walls",
+    "party_wall_points",
+    "shared_walls",
+    "wall_endpoints",
+    "from_lat_lon",
+    "heading_pitch",
+    "to_lat_lon",
+    "DownloadJob",
+    "download_images",
+    "ShardReader",
+    "ShardWriter",
+    "pack_folder",
+    "ImageStore",
+    "blob_key",
+    "DepthReader",
+    "DepthWriter",
+    "rle_encode",
+    "rle_decode",
+    "rle_area",
+    "MaskTable",
+    "mask_table",
+    "load_masks",
+    "read_table",
+    "iter_table",
+    "write_table",
+    "convert_table",
+    "TableWriter",
+    "MetadataCache",
+    "Telemetry",
+    "Throttle",
+    "RateLimiter",
+    "StreetViewClient",
+    "get_session_token",
+    "get_pano_location",
+    "get_panorama_ids",
+    "get_nearest_pano",
+    "image_url",
+    "parse_svi_file_name",
+    "svi_file_name",
+    "svi_folder_name",
+    "download_image",
+]
@@ -0,0 +1,57 @@
+"""Adjacent building detection.
+
+Port of ``QGIS/adjacencySelector.py``: a building is adjacent when another
+footprint lies within ``tolerance`` (layer units) of it. Instead of
+buffering every footprint, all footprints are queried against one packed
+STRtree with the ``dwithin`` predicate, in chunks of ``chunk_size``.
+"""
+
+import numpy as np
+import shapely
+
+CHUNK_SIZE = 100_000
+
+
+def adjacency_pairs(geoms, tolerance, chunk_size=CHUNK_SIZE, progress=None, should_stop=None):
+    """Return ``(left, right)`` index arrays of every adjacent pair.
+
+    Each unordered pair appears once with ``left < right``, sorted by
+    ``left`` then ``right``. ``progress`` is an optional callback receiving
+    an integer percentage and ``should_stop`` an optional callable checked
+    between chunks to abort early (returns ``None``).
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    total = len(geoms)
+    tree = shapely.STRtree(geoms)
+
+    lefts, rights = [], []
+    for start in range(0, total, chunk_size):
+        if should_stop is not None and should_stop():
+            return None
+        source, target = tree.query(geoms[start:start + chunk_size], predicate="dwithin", distance=tolerance)
+        source += start
+        keep = source < target
+        lefts.append(source[keep])
+        rights.append(target[keep])
+
+        if progress is not None:
+            progress(int(min(start + chunk_size, total) / total * 100))
+
+    if not lefts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    left = np.concatenate(lefts).astype(np.int64)
+    right = np.concatenate(rights).astype(np.int64)
+    order = np.lexsort((right, left))
+    return left[order], right[order]
+
+
+def find_adjacent_buildings(geoms, tolerance, chunk_size=CHUNK_SIZE, progress=None, should_stop=None):
+    """Return the sorted positions of buildings that touch another one.
+
+    Same arguments as :func:`adjacency_pairs`; returns ``None`` if aborted.
+    """
+    pairs = adjacency_pairs(geoms, tolerance, chunk_size=chunk_size,
+                            progress=progress, should_stop=should_stop)
+    if pairs is None:
+        return None
+    return np.unique(np.concatenate(pairs))
@@ -0,0 +1,312 @@
+"""Synthetic row-house cities and a benchmark of the geometry stages.
+
+:func:`synthetic_city` lays out blocks of back-to-back row houses along a
+street grid. Neighbouring houses share a party wall, except for a
+``gap_fraction`` of them that are ``gap`` metres apart, and every shared
+wall is shifted by up to ``jitter`` to mimic digitizing noise. The layout
+only depends on its arguments and ``seed``, so every commit benchmarks the
+same city.
+
+:func:`run_benchmark` times the stages behind the QGIS tools on such a city
+(``getAdjacentBuildings.py``, ``adjacencySelector.Worker``, party walls,
+``assignIndex.Worker`` and the LR indexing step) and records wall and CPU
+time and peak resident memory per stage. Each size runs in a fresh process
+so memory peaks do not carry over. Results are appended as JSON lines
+tagged with the git commit, so runs of different commits can be compared
+with :func:`compare`.
+
+Run ``python -m faultlines.benchmark --sizes 1000 100000`` for the command
+line tool.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import shapely
+
+from .adjacency import find_adjacent_buildings
+from .graph import build_adjacency_graph
+from .indexing import assign_lr_index, label_sides
+from .telemetry import Telemetry
+from .tiling import tiled_adjacency_graph
+from .walls import party_wall_points
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DEFAULT_OUTPUT = "benchmarks.jsonl"
+STAGE_NAMES = ("adjacent_buildings", "adjacency_graph", "tiled_adjacency_graph", "party_walls",
+               "assign_index", "label_sides")
+SAMPLE_INTERVAL = 0.01
+
+
+def synthetic_city(footprints, houses_per_row=20, width=(5.0, 8.0), depth=(10.0, 14.0), gap=2.0,
+                   gap_fraction=0.1, jitter=0.05, yard=10.0, street_width=15.0, seed=0):
+    """Return a city of ``footprints`` row houses as ``{"geoms", "labels", "streets"}``.
+
+    Each block holds two rows of ``houses_per_row`` houses, back to back
+    across a ``yard``, with a street in front of each row. House widths and
+    depths are drawn uniformly from ``width`` and ``depth`` (metres). A
+    ``gap_fraction`` of party walls are ``gap`` metres wide instead of
+    shared, and shared walls are offset by up to ``jitter``. Blocks fill a
+    square grid; ``labels`` are the building indices ``1..footprints``.
+    """
+    rng = np.random.default_rng(seed)
+    rows = max(1, -(-footprints // houses_per_row))
+    widths = rng.uniform(*width, size=(rows, houses_per_row))
+    depths = rng.uniform(*depth, size=(rows, houses_per_row))
+    gaps = np.where(rng.random((rows, houses_per_row)) < gap_fraction, gap,
+                    rng.uniform(-jitter, jitter, size=(rows, houses_per_row)))
+    gaps[:, 0] = 0.0
+    x0 = np.cumsum(widths + gaps, axis=1) - widths
+    x1 = x0 + widths
+
+    blocks = -(-rows // 2)
+    columns = int(np.ceil(np.sqrt(blocks)))
+    block_width = float(x1.max()) + street_width
+    block_height = 2 * depth[1] + yard + street_width
+    block = np.arange(rows) // 2
+    origin_x = (block % columns) * block_width
+    origin_y = (block // columns) * block_height
+    back_row = (np.arange(rows) % 2 == 1)[:, None]
+    y_front = origin_y[:, None] + np.where(back_row, 2 * depth[1] + yard, 0.0)
+    y0 = np.where(back_row, y_front - depths, y_front)
+    y1 = np.where(back_row, y_front, y_front + depths)
+
+    geoms = shapely.box((x0 + origin_x[:, None]).ravel(), y0.ravel(),
+                        (x1 + origin_x[:, None]).ravel(), y1.ravel())[:footprints]
+
+    grid_rows = -(-blocks // columns)
+    span_x, span_y = columns * block_width, grid_rows * block_height
+    half = street_width / 2
+    # One street below each block row (the front of its first houses) and above its back row.
+    street_y = np.concatenate([np.arange(grid_rows) * block_height - half,
+                               np.arange(grid_rows) * block_height + 2 * depth[1] + yard + half])
+    street_x = np.arange(columns + 1) * block_width - half
+    streets = np.concatenate([
+        shapely.linestrings(np.stack([np.stack([np.full_like(street_y, -half), street_y], axis=1),
+                                      np.stack([np.full_like(street_y, span_x), street_y], axis=1)], axis=1)),
+        shapely.linestrings(np.stack([np.stack([street_x, np.full_like(street_x, -half)], axis=1),
+                                      np.stack([street_x, np.full_like(street_x, span_y)], axis=1)], axis=1)),
+    ])
+    return {"geoms": geoms, "labels": np.arange(1, len(geoms) + 1), "streets": streets}
+
+
+def _rss():
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if platform.system() == "Darwin" else peak * 1024
+
+
+class MemorySampler:
+    """Sample the resident set size on a thread while the block runs.
+
+    After the block, ``start`` is the RSS on entry and ``peak`` the highest
+    value seen, in bytes.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.start = self.peak = 0
+        self.done = threading.Event()
+
+    def __enter__(self):
+        self.start = self.peak = _rss()
+        self.done.clear()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.done.set()
+        self.thread.join()
+        self.peak = max(self.peak, _rss())
+
+    def _sample(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, _rss())
+
+
+def _label_table(walls, labels, seed):
+    rng = np.random.default_rng(seed)
+    n = len(walls["points"])
+    street = rng.uniform(0, 360, n)
+    return {
+        "rot1": street + rng.uniform(-180, 180, n),
+        "rot2": street + rng.uniform(-180, 180, n),
+        "rotation-s": street,
+        "intix1": labels[walls["left"]],
+        "intix2": labels[walls["right"]],
+    }
+
+
+def _run_size(size, city_options, tolerance, index_tolerance, workers, stages):
+    telemetry = Telemetry(f"size-{size}")
+    memory = {}
+
+    def timed(name, function):
+        with MemorySampler() as sampler, telemetry.stage(name):
+            result = function()
+        memory[name] = sampler
+        return result
+
+    city = timed("generate", lambda: synthetic_city(size, **city_options))
+    geoms, labels = city["geoms"], city["labels"]
+    if "adjacent_buildings" in stages:
+        adjacent = timed("adjacent_buildings", lambda: find_adjacent_buildings(geoms, tolerance))
+        telemetry.count("adjacent_buildings", len(adjacent), stage="adjacent_buildings")
+    graph = timed("adjacency_graph", lambda: build_adjacency_graph(geoms, tolerance, labels=labels))
+    telemetry.count("edges", graph.edge_count, stage="adjacency_graph")
+    if "tiled_adjacency_graph" in stages and workers and workers > 1:
+        timed("tiled_adjacency_graph", lambda: tiled_adjacency_graph(geoms, tolerance, labels=labels, workers=workers))
+    walls = timed("party_walls", lambda: party_wall_points(geoms, tolerance, streets=city["streets"], graph=graph))
+    telemetry.count("walls", len(walls["points"]), stage="party_walls")
+    if "assign_index" in stages:
+        timed("assign_index", lambda: assign_lr_index(walls["points"], geoms, labels, tolerance=index_tolerance))
+    if "label_sides" in stages:
+        table = _label_table(walls, labels, city_options.get("seed", 0))
+        timed("label_sides", lambda: label_sides(table))
+
+    records = []
+    for name, data in telemetry.stages().items():
+        if not data["runs"]:
+            continue
+        records.append({
+            "size": size,
+            "stage": name,
+            "wall_seconds": round(data["wall_seconds"], 6),
+            "cpu_seconds": round(data["cpu_seconds"], 6),
+            "peak_rss_mb": round(memory[name].peak / 2 ** 20, 1),
+            "rss_growth_mb": round((memory[name].peak - memory[name].start) / 2 ** 20, 1),
+            "counters": data["counters"],
+        })
+    return records
+
+
+def git_commit(path=None):
+    """Return ``(commit, dirty)`` of the checkout holding ``path``, or ``(None, None)``."""
+    folder = os.path.dirname(os.path.abspath(path or __file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=folder, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=folder,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, tolerance=1.0, index_tolerance=10.0, workers=None, stages=STAGE_NAMES,
+                  output=None, isolate=True, **city_options):
+    """Benchmark ``stages`` on synthetic cities of each of ``sizes`` footprints.
+
+    ``city_options`` go to :func:`synthetic_city`. ``adjacency_graph`` and
+    ``party_walls`` always run because later stages need their output;
+    ``tiled_adjacency_graph`` only runs with ``workers`` above 1. Every
+    size runs in a fresh process unless ``isolate`` is false. Returns one
+    record per size and stage; with ``output`` they are also appended to
+    that JSON-lines file.
+    """
+    commit, dirty = git_commit()
+    run = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "shapely": shapely.__version__,
+        "geos": shapely.geos_version_string,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "tolerance": tolerance,
+        "index_tolerance": index_tolerance,
+        "workers": workers,
+        "city": city_options,
+    }
+    records = []
+    for size in sizes:
+        args = (size, city_options, tolerance, index_tolerance, workers, tuple(stages))
+        if isolate:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                results = pool.submit(_run_size, *args).result()
+        else:
+            results = _run_size(*args)
+        records.extend(dict(run, **record) for record in results)
+        if output:
+            with open(output, "a") as file:
+                for record in results:
+                    file.write(json.dumps(dict(run, **record)) + "\n")
+    return records
+
+
+def load_results(path):
+    """Read the records appended by :func:`run_benchmark`."""
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def compare(records, base, head, metric="wall_seconds"):
+    """Return ``(size, stage, base value, head value, head / base)`` rows for two commits.
+
+    When a commit was benchmarked more than once, its latest run counts.
+    """
+    def latest(commit):
+        values = {}
+        for record in sorted(records, key=lambda record: record["timestamp"]):
+            if record["commit"] == commit:
+                values[(record["size"], record["stage"])] = record[metric]
+        return values
+
+    before, after = latest(base), latest(head)
+    rows = []
+    for key in sorted(set(before) & set(after)):
+        ratio = after[key] / before[key] if before[key] else float("nan")
+        rows.append((*key, before[key], after[key], ratio))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the geometry stages on synthetic row-house cities.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="footprint counts")
+    parser.add_argument("--stages", nargs="+", default=list(STAGE_NAMES), choices=STAGE_NAMES)
+    parser.add_argument("--tolerance", type=float, default=1.0)
+    parser.add_argument("--index-tolerance", type=float, default=10.0)
+    parser.add_argument("--workers", type=int, default=None, help="processes for the tiled stage")
+    parser.add_argument("--houses-per-row", type=int, default=20)
+    parser.add_argument("--gap", type=float, default=2.0, help="width of broken party walls (m)")
+    parser.add_argument("--gap-fraction", type=float, default=0.1, help="share of party walls with a gap")
+    parser.add_argument("--jitter", type=float, default=0.05, help="offset of shared walls (m)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON-lines file results are appended to")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"),
+                        help="print the time ratios of two commits from --output instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        for size, stage, before, after, ratio in compare(load_results(args.output), *args.compare):
+            print(f"{size:>10} {stage:<22} {before:10.3f}s {after:10.3f}s {ratio:6.2f}x")
+        return 0
+
+    records = run_benchmark(args.sizes, tolerance=args.tolerance, index_tolerance=args.index_tolerance,
+                            workers=args.workers, stages=args.stages, output=args.output,
+                            houses_per_row=args.houses_per_row, gap=args.gap, gap_fraction=args.gap_fraction,
+                            jitter=args.jitter, seed=args.seed)
+    for record in records:
+        print(f"{record['size']:>10} {record['stage']:<22} {record['wall_seconds']:10.3f}s "
+              f"cpu {record['cpu_seconds']:10.3f}s peak {record['peak_rss_mb']:9.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
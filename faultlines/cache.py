@@ -0,0 +1,176 @@
+"""Persistent SQLite cache for Street View metadata lookups.
+
+Pano metadata is keyed by pano ID and location lookups by the quantized
+``lat``/``lng`` plus search radius, so overlapping blocks reuse earlier
+answers. Entries expire after ``ttl`` seconds and the least recently used
+ones are evicted once the cache holds more than ``max_entries``.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 5_000_000
+# 1e-5 degrees is about one metre of latitude.
+DEFAULT_QUANTUM = 1e-5
+# Keys per ``IN (...)`` query, below SQLite's bound-parameter limit.
+QUERY_BATCH = 500
+
+
+def default_cache_path():
+    """Return the shared cache location (``$FAULTLINES_CACHE`` overrides it)."""
+    path = os.environ.get("FAULTLINES_CACHE")
+    if path:
+        return path
+    return os.path.join(os.path.expanduser("~"), ".cache", "faultlines", "streetview.sqlite")
+
+
+class MetadataCache:
+    """SQLite-backed key/value cache with TTL, LRU eviction and counters.
+
+    Values are stored as JSON. The cache is safe to share between the
+    threads of a :class:`~faultlines.streetview.StreetViewClient`.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, quantum=DEFAULT_QUANTUM):
+        self.path = path or default_cache_path()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.quantum = quantum
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL,"
+            " PRIMARY KEY (kind, key))"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self.size = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def location_key(self, lat, lng, radius):
+        """Return the cache key of a location lookup."""
+        return f"{round(float(lat) / self.quantum)}:{round(float(lng) / self.quantum)}:{radius}"
+
+    def get(self, kind, key):
+        """Return the cached value, or ``None`` on a miss or expired entry."""
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT value, created FROM entries WHERE kind = ? AND key = ?",
+                                  (kind, key)).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                if row is not None:
+                    self.db.execute("DELETE FROM entries WHERE kind = ? AND key = ?", (kind, key))
+                    self.size -= 1
+                self.misses += 1
+                return None
+            self.db.execute("UPDATE entries SET accessed = ? WHERE kind = ? AND key = ?", (now, kind, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def get_many(self, kind, keys):
+        """Return ``{key: value}`` for the keys found in the cache.
+
+        The keys are looked up with one ``SELECT ... IN`` per
+        ``QUERY_BATCH`` keys, and the hits' access times are updated in one
+        transaction.
+        """
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        found, expired = {}, []
+        with self.lock:
+            for start in range(0, len(keys), QUERY_BATCH):
+                batch = keys[start:start + QUERY_BATCH]
+                rows = self.db.execute(f"SELECT key, value, created FROM entries WHERE kind = ?"
+                                       f" AND key IN ({', '.join('?' * len(batch))})", (kind, *batch))
+                for key, value, created in rows:
+                    if self.ttl is not None and now - created > self.ttl:
+                        expired.append((kind, key))
+                    else:
+                        found[key] = value
+            if found or expired:
+                with self._transaction():
+                    self.db.executemany("UPDATE entries SET accessed = ? WHERE kind = ? AND key = ?",
+                                        [(now, kind, key) for key in found])
+                    self.db.executemany("DELETE FROM entries WHERE kind = ? AND key = ?", expired)
+                self.size -= len(expired)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return {key: json.loads(value) for key, value in found.items()}
+
+    def set(self, kind, key, value):
+        """Store ``value`` under ``(kind, key)``."""
+        self.set_many(kind, {key: value})
+
+    def set_many(self, kind, items):
+        """Store every ``{key: value}`` of ``items`` in one transaction."""
+        if not items:
+            return
+        now = time.time()
+        rows = [(kind, key, json.dumps(value), now, now) for key, value in items.items()]
+        with self.lock:
+            with self._transaction():
+                before = self.db.total_changes
+                self.db.executemany("INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?)", rows)
+                inserted = self.db.total_changes - before
+                self.db.executemany("UPDATE entries SET value = ?, created = ?, accessed = ? WHERE kind = ? AND key = ?",
+                                    [(value, created, accessed, kind, key)
+                                     for kind, key, value, created, accessed in rows])
+            self.size += inserted
+            if self.max_entries is not None and self.size > self.max_entries:
+                self._evict()
+
+    @contextmanager
+    def _transaction(self):
+        # The connection is in autocommit mode; roll back if any statement fails.
+        self.db.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def _evict(self):
+        # Drop the least recently used tenth so eviction does not run on every insert.
+        excess = self.size - self.max_entries + max(1, self.max_entries // 10)
+        self.db.execute("DELETE FROM entries WHERE rowid IN"
+                        " (SELECT rowid FROM entries ORDER BY accessed LIMIT ?)", (excess,))
+        removed = self.db.execute("SELECT changes()").fetchone()[0]
+        self.size -= removed
+        self.evictions += removed
+
+    def purge_expired(self):
+        """Delete every expired entry and return how many were removed."""
+        if self.ttl is None:
+            return 0
+        with self.lock:
+            self.db.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,))
+            removed = self.db.execute("SELECT changes()").fetchone()[0]
+            self.size -= removed
+        return removed
+
+    def stats(self):
+        """Return the hit/miss/eviction counters and current size."""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": self.size}
@@ -0,0 +1,269 @@
+"""Batched monocular depth estimation for SVI images.
+
+Scriptable replacement for ``process_folder`` in ``Depth Estimation.ipynb``
+and the ZoeDepth loop in ``FL02 - Depth.ipynb``. Images are decoded and
+preprocessed by ``DataLoader`` workers, prefetched, and run through the model
+in batches under ``torch.inference_mode`` (optionally with bfloat16
+autocast on CPU). :func:`benchmark` reports throughput in images per second.
+Besides the notebooks' normalized PNGs, raw float16 depth can be kept in a
+:class:`~faultlines.depthmaps.DepthWriter` store.
+
+Run ``python -m faultlines.depth INPUT OUTPUT`` for the command line tool.
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset, IterableDataset, get_worker_info
+
+from .depthmaps import DepthWriter
+from .shards import ShardReader, decode_image, index_path, list_images
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "Intel/dpt-large"
+ZOEDEPTH_REPO = "isl-org/ZoeDepth"
+ZOEDEPTH_WEIGHTS = "https://github.com/isl-org/ZoeDepth/releases/download/v1.0/ZoeD_M12_NK.pt"
+OUTPUTS = ("png", "raw", "both")
+RAW_PREFIX = "depth"
+
+
+def load_dpt(name=DEFAULT_MODEL, device="cpu"):
+    """Load a DPT depth model and its image processor once."""
+    from transformers import DPTForDepthEstimation, DPTImageProcessor
+
+    processor = DPTImageProcessor.from_pretrained(name)
+    model = DPTForDepthEstimation.from_pretrained(name).to(device).eval()
+    return model, processor
+
+
+class TensorProcessor:
+    """Minimal processor turning PIL images into ``[0, 1]`` pixel tensors."""
+
+    def __call__(self, images, return_tensors="pt"):
+        array = np.asarray(images, dtype=np.float32) / 255.0
+        return {"pixel_values": torch.from_numpy(array).permute(2, 0, 1)[None]}
+
+
+class ZoeDepthModel(torch.nn.Module):
+    """Adapter giving ZoeDepth the ``model(pixel_values=...).predicted_depth`` interface."""
+
+    class Output:
+        def __init__(self, predicted_depth):
+            self.predicted_depth = predicted_depth
+
+    def __init__(self, zoe):
+        super().__init__()
+        self.zoe = zoe
+
+    def forward(self, pixel_values):
+        return self.Output(self.zoe.infer(pixel_values)[:, 0])
+
+
+def load_zoedepth(device="cpu"):
+    """Load ZoeD_NK with the M12 weights, as ``FL02 - Depth.ipynb`` does."""
+    zoe = torch.hub.load(ZOEDEPTH_REPO, "ZoeD_NK", pretrained=False)
+    weights = torch.hub.load_state_dict_from_url(ZOEDEPTH_WEIGHTS, map_location="cpu")
+    zoe.load_state_dict(weights["model"], strict=False)
+    for block in zoe.core.core.pretrained.model.blocks:
+        block.drop_path = torch.nn.Identity()
+    return ZoeDepthModel(zoe).to(device).eval(), TensorProcessor()
+
+
+class ImageFileDataset(Dataset):
+    """Image files decoded and preprocessed inside the loader workers."""
+
+    def __init__(self, paths, processor):
+        self.paths = list(paths)
+        self.processor = processor
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, i):
+        path = self.paths[i]
+        image = Image.open(path).convert("RGB")
+        pixels = self.processor(images=image, return_tensors="pt")["pixel_values"][0]
+        return os.path.splitext(os.path.basename(path))[0], pixels, image.size[::-1]
+
+
+class ShardDataset(IterableDataset):
+    """Images streamed from a shard set, split between loader workers by shard."""
+
+    def __init__(self, prefix, processor):
+        self.prefix = prefix
+        self.processor = processor
+
+    def __iter__(self):
+        reader = ShardReader(self.prefix)
+        worker = get_worker_info()
+        if worker is not None:
+            reader.entries = [entry for entry in reader.entries
+                              if entry["shard"] % worker.num_workers == worker.id]
+        for key, data in reader:
+            image = decode_image(data)
+            pixels = self.processor(images=image, return_tensors="pt")["pixel_values"][0]
+            yield key, pixels, image.size[::-1]
+
+
+def collate(items):
+    """Stack a batch, padding smaller images to the largest one.
+
+    Returns ``(keys, pixels, sizes, shapes)``: ``sizes`` are the original
+    image sizes and ``shapes`` the unpadded ``(height, width)`` of each
+    pixel tensor, so :func:`predict` can crop the padding back off.
+    """
+    keys, pixels, sizes = zip(*items)
+    shapes = [tuple(p.shape[-2:]) for p in pixels]
+    height, width = max(h for h, _ in shapes), max(w for _, w in shapes)
+    if any(shape != (height, width) for shape in shapes):
+        pixels = [torch.nn.functional.pad(p[None], (0, width - p.shape[-1], 0, height - p.shape[-2]),
+                                          mode="replicate")[0] for p in pixels]
+    return list(keys), torch.stack(pixels), list(sizes), shapes
+
+
+def make_loader(source, processor, batch_size=8, workers=4, prefetch=2, device="cpu"):
+    """Return a ``DataLoader`` over a folder, a shard prefix or a list of paths.
+
+    Batches are pinned for fast host-to-device copies when ``device`` is a
+    CUDA device.
+    """
+    if isinstance(source, str) and os.path.exists(index_path(source)):
+        dataset = ShardDataset(source, processor)
+    else:
+        paths = list_images(source) if isinstance(source, str) else source
+        dataset = ImageFileDataset(paths, processor)
+    return DataLoader(dataset, batch_size=batch_size, num_workers=workers, collate_fn=collate,
+                      prefetch_factor=prefetch if workers else None,
+                      persistent_workers=False, pin_memory=torch.device(device).type == "cuda")
+
+
+def _autocast(device, bf16):
+    if bf16:
+        return torch.autocast(device_type=torch.device(device).type, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def predict(model, loader, device="cpu", bf16=False):
+    """Yield ``(key, depth)`` with ``depth`` a float32 array at the image's own size."""
+    with torch.inference_mode(), _autocast(device, bf16):
+        for keys, pixels, sizes, shapes in loader:
+            depth = model(pixel_values=pixels.to(device, non_blocking=True)).predicted_depth.float()
+            if len(set(sizes)) == 1 and len(set(shapes)) == 1:
+                depth = torch.nn.functional.interpolate(depth.unsqueeze(1), size=sizes[0],
+                                                        mode="bicubic", align_corners=False)[:, 0]
+                resized = depth.cpu().numpy()
+            else:
+                # Crop the padding off, scaled to the prediction's resolution, then resize each map.
+                scale_h, scale_w = depth.shape[-2] / pixels.shape[-2], depth.shape[-1] / pixels.shape[-1]
+                resized = []
+                for d, size, (h, w) in zip(depth, sizes, shapes):
+                    d = d[:max(1, round(h * scale_h)), :max(1, round(w * scale_w))]
+                    resized.append(torch.nn.functional.interpolate(d[None, None], size=size, mode="bicubic",
+                                                                   align_corners=False)[0, 0].cpu().numpy())
+            yield from zip(keys, resized)
+
+
+def colorize(depth):
+    """Return the per-image normalized uint8 depth used by the notebooks."""
+    return (depth * 255 / np.max(depth)).astype("uint8")
+
+
+def process_folder(input_folder, output_folder, model=None, processor=None, device="cpu",
+                   batch_size=8, workers=4, bf16=False, output="png"):
+    """Run depth estimation on every image of ``input_folder`` (or shard prefix).
+
+    ``output`` is ``"png"`` for the notebooks' ``<name>_depth.png`` files,
+    ``"raw"`` for a float16 depth store at ``output_folder/depth`` (see
+    :class:`~faultlines.depthmaps.DepthReader`), or ``"both"``. Returns the
+    number of images processed.
+    """
+    if output not in OUTPUTS:
+        raise ValueError(f"output must be one of {OUTPUTS}, not {output!r}")
+    if model is None:
+        model, processor = load_dpt(device=device)
+    os.makedirs(output_folder, exist_ok=True)
+
+    count = 0
+    loader = make_loader(input_folder, processor, batch_size=batch_size, workers=workers, device=device)
+    with contextlib.ExitStack() as stack:
+        store = None
+        if output in ("raw", "both"):
+            store = stack.enter_context(DepthWriter(os.path.join(output_folder, RAW_PREFIX)))
+        for key, depth in predict(model, loader, device=device, bf16=bf16):
+            if store is not None:
+                store.write(key, depth)
+            if output in ("png", "both"):
+                Image.fromarray(colorize(depth)).save(os.path.join(output_folder, f"{key}_depth.png"))
+            count += 1
+    logger.info("Processed %d images into %s", count, output_folder)
+    return count
+
+
+def benchmark(model, loader, device="cpu", bf16=False, warmup=1):
+    """Run ``loader`` through ``model`` and return throughput figures.
+
+    The first ``warmup`` batches are excluded from the timing.
+    """
+    images, batches = 0, 0
+    start = time.perf_counter()
+    with torch.inference_mode(), _autocast(device, bf16):
+        for _, pixels, _, _ in loader:
+            model(pixel_values=pixels.to(device))
+            batches += 1
+            if batches == warmup:
+                start = time.perf_counter()
+            elif batches > warmup:
+                images += len(pixels)
+    seconds = time.perf_counter() - start
+    return {
+        "images": images,
+        "seconds": seconds,
+        "images_per_second": images / seconds if seconds > 0 else float("nan"),
+        "batch_size": loader.batch_size,
+        "workers": loader.num_workers,
+        "threads": torch.get_num_threads(),
+        "bf16": bf16,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batched depth estimation for SVI folders or shards.")
+    parser.add_argument("input", help="image folder or shard prefix")
+    parser.add_argument("output", nargs="?", help="output folder (omit with --benchmark)")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="DPT checkpoint, or 'zoedepth'")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", choices=OUTPUTS, default="png",
+                        help="normalized PNGs, raw float16 depth store, or both")
+    parser.add_argument("--bf16", action="store_true", help="bfloat16 autocast")
+    parser.add_argument("--benchmark", action="store_true", help="only report images/sec")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.model == "zoedepth":
+        model, processor = load_zoedepth(args.device)
+    else:
+        model, processor = load_dpt(args.model, args.device)
+
+    if args.benchmark:
+        loader = make_loader(args.input, processor, batch_size=args.batch_size, workers=args.workers,
+                             device=args.device)
+        print(json.dumps(benchmark(model, loader, device=args.device, bf16=args.bf16), indent=2))
+    else:
+        if not args.output:
+            parser.error("output folder is required")
+        process_folder(args.input, args.output, model, processor, device=args.device,
+                       batch_size=args.batch_size, workers=args.workers, bf16=args.bf16, output=args.output)
+
+
+if __name__ == "__main__":
+    main()
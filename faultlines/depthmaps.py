@@ -0,0 +1,114 @@
+"""Raw depth maps in chunked, memory-mappable ``.npy`` files.
+
+Depth maps are stored as float16, stacked ``chunk_size`` at a time into
+``prefix-000000.npy``, ``prefix-000001.npy``, ... with a
+``prefix.index.jsonl`` index mapping each image key to its chunk and slot.
+:class:`DepthReader` memory-maps the chunks, so reading a window of one map
+only touches the pages it covers and never re-runs the model.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from .shards import index_path
+
+DEPTH_DTYPE = np.float16
+DEPTH_CHUNK = 64
+
+
+class DepthWriter:
+    """Stack depth maps into ``.npy`` chunks and index them by key.
+
+    A chunk is written once it holds ``chunk_size`` maps or a map of a
+    different shape arrives. Use as a context manager so the last chunk and
+    the index are flushed.
+    """
+
+    def __init__(self, prefix, chunk_size=DEPTH_CHUNK):
+        self.prefix = prefix
+        self.chunk_size = chunk_size
+        self.chunk = -1
+        self.keys = []
+        self.maps = []
+        os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+        self.index = open(index_path(prefix), 'w')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def chunk_path(self, chunk):
+        return f"{self.prefix}-{chunk:06d}.npy"
+
+    def _flush(self):
+        if not self.maps:
+            return
+        self.chunk += 1
+        part = f"{self.chunk_path(self.chunk)}.part"
+        with open(part, 'wb') as file:
+            np.save(file, np.stack(self.maps))
+        os.replace(part, self.chunk_path(self.chunk))
+        for slot, key in enumerate(self.keys):
+            self.index.write(json.dumps({'key': key, 'chunk': self.chunk, 'slot': slot}) + '\n')
+        self.index.flush()
+        self.keys, self.maps = [], []
+
+    def write(self, key, depth):
+        """Add the depth map ``depth`` (a 2-D array) under ``key``."""
+        depth = np.asarray(depth, dtype=DEPTH_DTYPE)
+        if self.maps and (len(self.maps) >= self.chunk_size or depth.shape != self.maps[0].shape):
+            self._flush()
+        self.keys.append(str(key))
+        self.maps.append(depth)
+
+    def close(self):
+        self._flush()
+        self.index.close()
+
+
+class DepthReader:
+    """Memory-mapped access to a depth set written by :class:`DepthWriter`."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        with open(index_path(prefix)) as file:
+            self.entries = [json.loads(line) for line in file]
+        self.positions = {entry['key']: i for i, entry in enumerate(self.entries)}
+        self.chunks = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def keys(self):
+        return [entry['key'] for entry in self.entries]
+
+    def chunk_path(self, chunk):
+        return f"{self.prefix}-{chunk:06d}.npy"
+
+    def _chunk(self, chunk):
+        if chunk not in self.chunks:
+            self.chunks[chunk] = np.load(self.chunk_path(chunk), mmap_mode='r')
+        return self.chunks[chunk]
+
+    def read(self, key):
+        """Return the float16 depth map of ``key`` as a read-only memory map.
+
+        Slice the result (``reader.read(key)[rows, cols]``) to load only
+        that window.
+        """
+        entry = self.entries[self.positions[key]]
+        return self._chunk(entry['chunk'])[entry['slot']]
+
+    __getitem__ = read
+
+    def __iter__(self):
+        """Yield ``(key, depth)`` for every map in storage order."""
+        for entry in self.entries:
+            yield entry['key'], self._chunk(entry['chunk'])[entry['slot']]
@@ -0,0 +1,153 @@
+"""Concurrent, resumable Street View image downloads.
+
+Images are fetched by a bounded pool of threads sharing one
+:class:`~faultlines.streetview.StreetViewClient`. Every response is streamed
+to a temporary ``.part`` file and renamed into place once complete, so a
+crash never leaves a truncated image behind. Finished and failed jobs are
+appended to a journal; a restarted job skips everything the journal (or a
+valid file on disk) shows as done.
+"""
+
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .telemetry import count
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+JOURNAL_NAME = ".download_journal.jsonl"
+
+
+class DownloadJob:
+    """One image to fetch: ``url`` is written to ``path``; ``key`` identifies it in the journal."""
+
+    def __init__(self, key, url, path):
+        self.key = str(key)
+        self.url = url
+        self.path = path
+
+
+def is_valid_image(path):
+    """Return whether ``path`` holds a complete JPEG (SOI and EOI markers present)."""
+    try:
+        size = os.path.getsize(path)
+        if size < 4:
+            return False
+        with open(path, 'rb') as file:
+            head = file.read(2)
+            file.seek(-2, os.SEEK_END)
+            tail = file.read(2)
+    except OSError:
+        return False
+    return head == b'\xff\xd8' and tail == b'\xff\xd9'
+
+
+class Journal:
+    """Append-only JSON-lines record of finished downloads."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last line from an interrupted run.
+                        continue
+                    if entry.get('status') == 'ok':
+                        self.done[entry['key']] = entry['path']
+                    else:
+                        self.done.pop(entry['key'], None)
+        self.file = open(path, 'a')
+
+    def is_done(self, job):
+        return self.done.get(job.key) == job.path and os.path.exists(job.path)
+
+    def record(self, job, status):
+        with self.lock:
+            self.file.write(json.dumps({'key': job.key, 'path': job.path, 'status': status}) + '\n')
+            self.file.flush()
+            if status == 'ok':
+                self.done[job.key] = job.path
+
+    def close(self):
+        self.file.close()
+
+
+def fetch(client, job):
+    """Stream one job to disk through ``client``; return whether it succeeded."""
+    response = client.request('GET', job.url, stream=True)
+    if response is None or response.status_code != 200:
+        status = response.status_code if response is not None else "no response"
+        logger.warning("Couldn't download %s: %s", os.path.basename(job.path), status)
+        if response is not None:
+            response.close()
+        return False
+
+    part = f"{job.path}.part"
+    telemetry = getattr(client, 'telemetry', None)
+    try:
+        with response, open(part, 'wb') as file:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                file.write(chunk)
+                count(telemetry, 'bytes_downloaded', len(chunk))
+        os.replace(part, job.path)
+        count(telemetry, 'images_downloaded')
+    except Exception as e:
+        logger.warning("Couldn't write %s: %s", job.path, e)
+        if os.path.exists(part):
+            os.remove(part)
+        return False
+    return True
+
+
+def download_images(client, jobs, journal_path=None, workers=None, progress=None, should_stop=None):
+    """Download ``jobs`` concurrently and return the ``path`` (or ``None``) of each.
+
+    ``workers`` defaults to the client's concurrency. ``journal_path``
+    defaults to a journal file in the folder of the first job. Jobs whose
+    file already exists and is valid are skipped. ``progress`` is called
+    with ``(done, total)`` after each job and ``should_stop`` is checked
+    before a job starts.
+    """
+    jobs = list(jobs)
+    results = [None] * len(jobs)
+    if not jobs:
+        return results
+
+    journal = Journal(journal_path or os.path.join(os.path.dirname(jobs[0].path), JOURNAL_NAME))
+    pending = []
+    for i, job in enumerate(jobs):
+        if journal.is_done(job) or is_valid_image(job.path):
+            results[i] = job.path
+        else:
+            pending.append(i)
+    logger.info("%d of %d images already downloaded", len(jobs) - len(pending), len(jobs))
+
+    def run(i):
+        if should_stop is not None and should_stop():
+            return i, False
+        ok = fetch(client, jobs[i])
+        journal.record(jobs[i], 'ok' if ok else 'failed')
+        return i, ok
+
+    done = len(jobs) - len(pending)
+    try:
+        with ThreadPoolExecutor(max_workers=workers or client.concurrency) as pool:
+            for future in as_completed([pool.submit(run, i) for i in pending]):
+                i, ok = future.result()
+                if ok:
+                    results[i] = jobs[i].path
+                done += 1
+                if progress is not None:
+                    progress(done, len(jobs))
+    finally:
+        journal.close()
+    return results
@@ -0,0 +1,71 @@
+"""Coordinate helpers for the intersection and SVI point layers.
+
+Ports of ``QGIS/addLatLon.py`` and ``QGIS/getPitchHeading.py``.
+"""
+
+import numpy as np
+
+WGS84 = "EPSG:4326"
+# Approximate height of the Street View camera above the ground, in metres.
+CAMERA_HEIGHT = 2.5
+
+
+def to_lat_lon(x, y, crs):
+    """Transform projected ``x``/``y`` arrays in ``crs`` to ``(lat, lon)``."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if str(crs).upper() == WGS84:
+        return y.copy(), x.copy()
+
+    from pyproj import Transformer
+
+    transformer = Transformer.from_crs(crs, WGS84, always_xy=True)
+    lon, lat = transformer.transform(x, y)
+    return np.asarray(lat), np.asarray(lon)
+
+
+def from_lat_lon(lat, lon, crs):
+    """Transform ``lat``/``lon`` arrays to ``(x, y)`` in ``crs``."""
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    if str(crs).upper() == WGS84:
+        return lon.copy(), lat.copy()
+
+    from pyproj import Transformer
+
+    transformer = Transformer.from_crs(WGS84, crs, always_xy=True)
+    x, y = transformer.transform(lon, lat)
+    return np.asarray(x), np.asarray(y)
+
+
+def heading_pitch(lat_intp, lon_intp, lat_svi, lon_svi, target_height=None, camera_height=CAMERA_HEIGHT,
+                  target_elevation=None, camera_elevation=None):
+    """Return ``(heading, pitch)`` from each SVI location to its target point.
+
+    The heading is the forward geodesic azimuth on the WGS84 ellipsoid in
+    degrees clockwise from north (``-180`` to ``180``). The pitch is
+    ``atan2(dz, distance)`` in degrees over the geodesic distance in metres,
+    with the target ``target_height`` above ``target_elevation`` and the
+    camera ``camera_height`` above ``camera_elevation``. Missing (``None`` or
+    NaN) target heights aim at camera height and missing elevations count as
+    0, so without building heights or a DEM the pitch is 0 as before. All
+    arguments may be scalars or arrays; NaN coordinates give NaN.
+    """
+    from pyproj import Geod
+
+    lat_intp, lon_intp, lat_svi, lon_svi = np.broadcast_arrays(
+        *(np.asarray(values, dtype=float) for values in (lat_intp, lon_intp, lat_svi, lon_svi)))
+    heading, _, distance = Geod(ellps="WGS84").inv(lon_svi, lat_svi, lon_intp, lat_intp)
+    heading = np.asarray(heading, dtype=float)
+    distance = np.asarray(distance, dtype=float)
+
+    def height(values, default):
+        if values is None:
+            return default
+        values = np.asarray(values, dtype=float)
+        return np.where(np.isnan(values), default, values)
+
+    dz = (height(target_elevation, 0.0) + height(target_height, camera_height)
+          - height(camera_elevation, 0.0) - camera_height)
+    pitch = np.degrees(np.arctan2(dz, distance)) + np.zeros_like(heading)
+    return heading, pitch
@@ -0,0 +1,137 @@
+"""Adjacency graph of building footprints in compressed sparse row form.
+
+Node ``i`` is the ``i``-th footprint; its neighbours are
+``indices[offsets[i]:offsets[i + 1]]`` with the matching shared-wall
+lengths in ``shared_length``. The graph is stored as an uncompressed
+``.npz`` sidecar so :func:`load_graph` can memory-map it.
+"""
+
+import numpy as np
+import shapely
+
+from .adjacency import CHUNK_SIZE, adjacency_pairs
+from .npz import mmap_member, save_npz, storable
+from .walls import shared_walls
+
+GRAPH_ARRAYS = ("labels", "offsets", "indices", "shared_length")
+
+
+class AdjacencyGraph:
+    """Symmetric building adjacency graph.
+
+    ``labels`` holds the building index of each node, ``offsets`` the
+    ``n + 1`` row offsets and ``indices``/``shared_length`` the neighbour
+    positions and shared-wall lengths of every row. The length of edge
+    ``(i, j)`` is measured on ``i``'s boundary, so it can differ slightly
+    from ``(j, i)`` when the walls are not parallel.
+    """
+
+    def __init__(self, labels, offsets, indices, shared_length):
+        self.labels = labels
+        self.offsets = offsets
+        self.indices = indices
+        self.shared_length = shared_length
+        self._positions = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def edge_count(self):
+        return len(self.indices) // 2
+
+    def degree(self):
+        """Return the number of neighbours of every node."""
+        return np.diff(self.offsets)
+
+    def neighbors(self, i):
+        """Return the neighbour positions of node ``i``."""
+        return self.indices[self.offsets[i]:self.offsets[i + 1]]
+
+    def shared_lengths(self, i):
+        """Return the shared-wall lengths of node ``i``, aligned with :meth:`neighbors`."""
+        return self.shared_length[self.offsets[i]:self.offsets[i + 1]]
+
+    def position(self, label):
+        """Return the node position of the building labelled ``label``."""
+        if self._positions is None:
+            self._positions = {label: i for i, label in enumerate(self.labels.tolist())}
+        return self._positions[label]
+
+    def neighbor_labels(self, label):
+        """Return the building labels adjacent to the building ``label``."""
+        return self.labels[self.neighbors(self.position(label))]
+
+    def pairs(self):
+        """Return ``(left, right)`` arrays with each edge once, ``left < right``."""
+        rows = np.repeat(np.arange(len(self), dtype=np.int64), self.degree())
+        keep = rows < self.indices
+        return rows[keep], self.indices[keep]
+
+    def save(self, path):
+        """Write the graph to an uncompressed ``.npz`` file at ``path`` and return ``path``."""
+        return save_npz(path, {name: np.asarray(getattr(self, name)) for name in GRAPH_ARRAYS})
+
+
+def shared_lengths(geoms, left, right, tolerance):
+    """Return the length of ``left``'s boundary running along ``right``.
+
+    The wall is cut as in :func:`~faultlines.walls.shared_walls`, so it
+    ends at the wall corners and leaves out the facades. Swap ``left`` and
+    ``right`` for the length measured on the other footprint.
+    """
+    return shapely.length(shared_walls(geoms, left, right, tolerance))
+
+
+def from_pairs(left, right, n, labels=None, lengths=None, reverse_lengths=None):
+    """Build an :class:`AdjacencyGraph` over ``n`` nodes from an edge list.
+
+    ``lengths`` weight the ``(left, right)`` edges and ``reverse_lengths``
+    the ``(right, left)`` ones; they default to ``lengths``.
+    """
+    left = np.asarray(left, dtype=np.int64)
+    right = np.asarray(right, dtype=np.int64)
+    if lengths is None:
+        lengths = np.zeros(len(left), dtype=np.float64)
+    if reverse_lengths is None:
+        reverse_lengths = lengths
+    if labels is None:
+        labels = np.arange(n, dtype=np.int64)
+
+    rows = np.concatenate([left, right])
+    cols = np.concatenate([right, left])
+    weights = np.concatenate([lengths, reverse_lengths])
+    order = np.lexsort((cols, rows))
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=offsets[1:])
+    return AdjacencyGraph(storable(labels), offsets, cols[order], weights[order].astype(np.float64))
+
+
+def build_adjacency_graph(geoms, tolerance, labels=None, chunk_size=CHUNK_SIZE, progress=None, should_stop=None):
+    """Detect adjacent footprints and return them as an :class:`AdjacencyGraph`.
+
+    ``labels`` defaults to the footprint positions. Returns ``None`` if
+    ``should_stop`` aborted the run.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    pairs = adjacency_pairs(geoms, tolerance, chunk_size=chunk_size,
+                            progress=progress, should_stop=should_stop)
+    if pairs is None:
+        return None
+    left, right = pairs
+    return from_pairs(left, right, len(geoms), labels=labels,
+                      lengths=shared_lengths(geoms, left, right, tolerance),
+                      reverse_lengths=shared_lengths(geoms, right, left, tolerance))
+
+
+def load_graph(path, mmap=True):
+    """Read a graph written by :meth:`AdjacencyGraph.save`.
+
+    With ``mmap`` the arrays are memory-mapped straight out of the
+    ``.npz`` archive, so opening a city-sized graph costs no I/O until
+    rows are read.
+    """
+    if not mmap:
+        with np.load(path) as data:
+            return AdjacencyGraph(*(data[name] for name in GRAPH_ARRAYS))
+    return AdjacencyGraph(*(mmap_member(path, name) for name in GRAPH_ARRAYS))
@@ -0,0 +1,238 @@
+"""Conversion between QGIS vector layers and the core's array inputs.
+
+Only the QGIS wrappers import this module; the rest of the package never
+touches ``qgis``.
+"""
+
+import numpy as np
+import shapely
+
+from .telemetry import PROGRESS_INTERVAL, Throttle
+
+FEATURE_CHUNK = 10_000
+
+
+def layer_geometries(layer, request=None):
+    """Return ``(fids, geoms, features)`` for every feature of ``layer``.
+
+    ``geoms`` is an object array of Shapely geometries with ``None`` for
+    null geometries.
+    """
+    features = list(layer.getFeatures(request) if request is not None else layer.getFeatures())
+    fids = np.array([feature.id() for feature in features], dtype=np.int64)
+    wkb = [None if feature.geometry().isNull() else bytes(feature.geometry().asWkb())
+           for feature in features]
+    return fids, shapely.from_wkb(wkb), features
+
+
+def feature_values(features, name):
+    """Return attribute ``name`` of ``features`` as an object array."""
+    return np.array([feature[name] for feature in features], dtype=object)
+
+
+def point_coordinates(layer):
+    """Return ``(fids, x, y)`` arrays for the point features of ``layer``.
+
+    Attributes are not fetched. Null geometries get ``NaN`` coordinates.
+    """
+    from qgis.core import QgsFeatureRequest
+
+    request = QgsFeatureRequest().setNoAttributes()
+    fids, x, y = [], [], []
+    for feature in layer.getFeatures(request):
+        geometry = feature.geometry()
+        fids.append(feature.id())
+        if geometry.isNull():
+            x.append(np.nan)
+            y.append(np.nan)
+        else:
+            point = geometry.asPoint()
+            x.append(point.x())
+            y.append(point.y())
+    return np.array(fids, dtype=np.int64), np.array(x, dtype=float), np.array(y, dtype=float)
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _text(value):
+    # PyQGIS returns NULL attributes as null QVariants.
+    if value is None or (hasattr(value, "isNull") and value.isNull()):
+        return None
+    return str(value)
+
+
+def numeric_columns(layer, names, text=()):
+    """Return ``(fids, {name: values})`` for fields ``names`` of ``layer``.
+
+    Only those attributes are fetched, without geometries, in one pass.
+    ``names`` come back as float arrays, with ``NaN`` for NULL and
+    non-numeric values; fields in ``text`` come back as object arrays of
+    strings, with ``None`` for NULL.
+    """
+    from qgis.core import QgsFeatureRequest
+
+    request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+    request.setSubsetOfAttributes(list(names) + list(text), layer.fields())
+    fids, rows, strings = [], [], []
+    for feature in layer.getFeatures(request):
+        fids.append(feature.id())
+        rows.append([_float(feature[name]) for name in names])
+        strings.append([_text(feature[name]) for name in text])
+    values = np.array(rows, dtype=float).reshape(len(rows), len(names))
+    columns = {name: values[:, i] for i, name in enumerate(names)}
+    for i, name in enumerate(text):
+        columns[name] = np.array([row[i] for row in strings], dtype=object)
+    return np.array(fids, dtype=np.int64), columns
+
+
+def raster_values(raster, lat, lon, band=1):
+    """Sample ``band`` of the raster layer ``raster`` at ``lat``/``lon`` points.
+
+    Points are transformed to the raster's CRS in one call; points outside
+    the raster or on no-data cells get ``NaN``.
+    """
+    from qgis.core import QgsPointXY
+
+    from .geo import from_lat_lon
+
+    crs = raster.crs()
+    x, y = from_lat_lon(lat, lon, crs.authid() or crs.toWkt())
+    provider = raster.dataProvider()
+    values = np.full(len(x), np.nan)
+    for i, (px, py) in enumerate(zip(x.tolist(), y.tolist())):
+        if np.isnan(px) or np.isnan(py):
+            continue
+        value, ok = provider.sample(QgsPointXY(px, py), band)
+        if ok:
+            values[i] = value
+    return values
+
+
+def line_features(fields, x0, y0, x1, y1, attributes=None):
+    """Yield a two-point line feature from ``(x0, y0)`` to ``(x1, y1)`` per row.
+
+    Geometries are built as one Shapely array and handed over as WKB.
+    ``attributes`` maps field names of ``fields`` to per-row values. Rows
+    with a NaN coordinate are skipped.
+    """
+    from qgis.core import QgsFeature, QgsGeometry
+
+    coords = np.stack([np.asarray(values, dtype=float) for values in (x0, y0, x1, y1)], axis=1)
+    rows = np.flatnonzero(~np.isnan(coords).any(axis=1))
+    wkb = shapely.to_wkb(shapely.linestrings(coords[rows].reshape(-1, 2, 2)))
+    attributes = attributes or {}
+    for row, data in zip(rows.tolist(), wkb):
+        feature = QgsFeature(fields)
+        geometry = QgsGeometry()
+        geometry.fromWkb(data)
+        feature.setGeometry(geometry)
+        for name, values in attributes.items():
+            value = values[row]
+            feature[name] = value.item() if isinstance(value, np.generic) else value
+        yield feature
+
+
+def add_features(sink, features, chunk_size=FEATURE_CHUNK):
+    """Add ``features`` to ``sink`` in chunks of ``chunk_size``; return the count added.
+
+    ``sink`` is anything with ``addFeatures``: a layer's data provider or a
+    ``QgsVectorFileWriter``.
+    """
+    added, chunk = 0, []
+    for feature in features:
+        chunk.append(feature)
+        if len(chunk) == chunk_size:
+            added += _add_chunk(sink, chunk)
+            chunk = []
+    if chunk:
+        added += _add_chunk(sink, chunk)
+    return added
+
+
+def _add_chunk(sink, chunk):
+    result = sink.addFeatures(chunk)
+    ok = result[0] if isinstance(result, tuple) else result
+    if not ok:
+        raise RuntimeError(f"Failed to add {len(chunk)} features")
+    return len(chunk)
+
+
+def write_columns(layer, fids, columns):
+    """Write ``{field name: values}`` for ``fids`` in one provider call.
+
+    Values that are ``None`` or ``NaN`` are left untouched. Returns whether
+    the provider accepted the changes.
+    """
+    fields = layer.fields()
+    indexes = {name: fields.indexFromName(name) for name in columns}
+    changes = {}
+    for row, fid in enumerate(np.asarray(fids).tolist()):
+        attrs = {}
+        for name, values in columns.items():
+            value = values[row]
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                continue
+            attrs[indexes[name]] = value.item() if isinstance(value, np.generic) else value
+        if attrs:
+            changes[fid] = attrs
+    return layer.dataProvider().changeAttributeValues(changes)
+
+
+class MessageBarProgress:
+    """One message-bar entry with a progress bar, updated in place.
+
+    Call it as ``progress(done, total)`` (e.g. as the ``progress`` callback
+    of :func:`~faultlines.download.download_images`); updates are throttled
+    to one every ``interval`` seconds and let QGIS repaint. With
+    ``cancellable`` the entry has a Cancel button and :meth:`should_stop`
+    returns true once it was clicked. Call :meth:`close` to remove the entry.
+    """
+
+    def __init__(self, message_bar, title, text="", interval=PROGRESS_INTERVAL, cancellable=False):
+        from qgis.PyQt import QtWidgets
+
+        self.message_bar = message_bar
+        self.text = text
+        self.cancelled = False
+        self.widget = message_bar.createMessage(title, text)
+        self.bar = QtWidgets.QProgressBar()
+        self.bar.setMaximum(100)
+        self.widget.layout().addWidget(self.bar)
+        if cancellable:
+            button = QtWidgets.QPushButton("Cancel")
+            button.clicked.connect(self.cancel)
+            self.widget.layout().addWidget(button)
+        message_bar.pushWidget(self.widget)
+        self.throttle = Throttle(self._update, interval=interval)
+
+    def __call__(self, done, total=None):
+        self.throttle(done, total)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def should_stop(self):
+        """Return whether Cancel was clicked; lets QGIS handle the click first."""
+        from qgis.PyQt.QtCore import QCoreApplication
+
+        QCoreApplication.processEvents()
+        return self.cancelled
+
+    def _update(self, done, total):
+        from qgis.PyQt.QtCore import QCoreApplication
+
+        if total:
+            self.bar.setValue(int(done / total * 100))
+            self.widget.setText(f"{self.text} {done} of {total}".strip())
+        else:
+            self.bar.setMaximum(0)
+            self.widget.setText(f"{self.text} {done}".strip())
+        QCoreApplication.processEvents()
+
+    def close(self):
+        self.message_bar.popWidget(self.widget)
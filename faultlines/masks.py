@@ -0,0 +1,187 @@
+"""Run-length encoded segmentation masks.
+
+A mask is flattened in row-major order and stored as the lengths of its
+alternating runs, starting with a (possibly empty) run of background, as
+``uint32`` counts. Window masks cover a small part of an SVI half, so this
+is a fraction of the size of the dense 8-bit PNGs the notebook wrote.
+
+:class:`MaskTable` keeps the masks of a whole run in one columnar ``.npz``
+file laid out like :class:`~faultlines.graph.AdjacencyGraph`: one row per
+image half, CSR offsets to its masks and to their RLE counts. Each half is
+tied to the building it shows (``indexL`` for the left half, ``indexR`` for
+the right one, as encoded in the SVI file name), so per-building facade
+statistics are a group-by over arrays.
+"""
+
+import numpy as np
+
+from .npz import mmap_member, save_npz, storable
+from .streetview import parse_svi_file_name
+
+RLE_DTYPE = np.uint32
+HALF_ARRAYS = ("key", "rowId", "panoId", "side", "building", "height", "width", "offset", "half_offsets")
+MASK_ARRAYS = ("boxes", "scores", "area", "count_offsets", "counts")
+
+
+def rle_encode(mask):
+    """Return the run-length counts of the 2-D boolean ``mask``."""
+    flat = np.asarray(mask, dtype=bool).ravel()
+    if flat.size == 0:
+        return np.zeros(0, dtype=RLE_DTYPE)
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate(([0], changes, [flat.size])))
+    if flat[0]:
+        counts = np.concatenate(([0], counts))
+    return counts.astype(RLE_DTYPE)
+
+
+def rle_decode(counts, shape):
+    """Return the boolean mask of ``shape`` encoded by ``counts``."""
+    counts = np.asarray(counts, dtype=np.int64)
+    values = np.zeros(len(counts), dtype=bool)
+    values[1::2] = True
+    return np.repeat(values, counts).reshape(shape)
+
+
+def rle_area(counts):
+    """Return the number of foreground pixels of an encoded mask."""
+    return int(np.asarray(counts, dtype=np.int64)[1::2].sum())
+
+
+class MaskTable:
+    """Segmentation masks of many SVI halves.
+
+    Half ``i`` is identified by ``key``, ``rowId``, ``panoId`` and ``side``
+    (``"L"`` or ``"R"``) and shows ``building``. Its masks are
+    ``half_offsets[i]:half_offsets[i + 1]``; mask ``m`` has a ``boxes[m]``
+    box in half coordinates, a ``scores[m]`` score, ``area[m]`` pixels and
+    the RLE counts ``counts[count_offsets[m]:count_offsets[m + 1]]``.
+    """
+
+    def __init__(self, key, rowId, panoId, side, building, height, width, offset, half_offsets,
+                 boxes, scores, area, count_offsets, counts):
+        self.key = key
+        self.rowId = rowId
+        self.panoId = panoId
+        self.side = side
+        self.building = building
+        self.height = height
+        self.width = width
+        self.offset = offset
+        self.half_offsets = half_offsets
+        self.boxes = boxes
+        self.scores = scores
+        self.area = area
+        self.count_offsets = count_offsets
+        self.counts = counts
+        self._positions = None
+
+    def __len__(self):
+        return len(self.half_offsets) - 1
+
+    @property
+    def mask_count(self):
+        return len(self.area)
+
+    def mask_half(self):
+        """Return the half position of every mask."""
+        return np.repeat(np.arange(len(self)), np.diff(self.half_offsets))
+
+    def position(self, rowId, panoId, side):
+        """Return the position of the half ``(rowId, panoId, side)``."""
+        if self._positions is None:
+            self._positions = {(str(r), str(p), str(s)): i
+                               for i, (r, p, s) in enumerate(zip(self.rowId, self.panoId, self.side))}
+        return self._positions[(str(rowId), str(panoId), str(side))]
+
+    def decode(self, m):
+        """Return mask ``m`` as a boolean array of its half's shape."""
+        i = np.searchsorted(self.half_offsets, m, side="right") - 1
+        counts = self.counts[self.count_offsets[m]:self.count_offsets[m + 1]]
+        return rle_decode(counts, (int(self.height[i]), int(self.width[i])))
+
+    def masks(self, i):
+        """Return the decoded masks of half ``i``."""
+        return [self.decode(m) for m in range(self.half_offsets[i], self.half_offsets[i + 1])]
+
+    def building_stats(self):
+        """Return per-building facade statistics.
+
+        The dict holds, for every distinct ``building``, the number of
+        ``views`` (halves) showing it, the number of ``windows`` (masks), the
+        summed ``window_area`` (overlapping masks count twice) and
+        ``view_area`` in pixels, and ``window_ratio``, their quotient.
+        """
+        buildings, inverse = np.unique(np.asarray(self.building), return_inverse=True)
+        windows = np.diff(self.half_offsets)
+        half_area = np.bincount(self.mask_half(), weights=self.area, minlength=len(self))
+        view_area = np.asarray(self.height, dtype=np.int64) * np.asarray(self.width)
+        n = len(buildings)
+        stats = {
+            "building": buildings,
+            "views": np.bincount(inverse, minlength=n),
+            "windows": np.bincount(inverse, weights=windows, minlength=n).astype(np.int64),
+            "window_area": np.bincount(inverse, weights=half_area, minlength=n).astype(np.int64),
+            "view_area": np.bincount(inverse, weights=view_area, minlength=n).astype(np.int64),
+        }
+        with np.errstate(invalid="ignore", divide="ignore"):
+            stats["window_ratio"] = stats["window_area"] / stats["view_area"]
+        return stats
+
+    def save(self, path):
+        """Write the table to an uncompressed ``.npz`` file at ``path`` and return ``path``."""
+        return save_npz(path, {name: storable(getattr(self, name)) for name in HALF_ARRAYS + MASK_ARRAYS})
+
+
+def mask_table(records):
+    """Build a :class:`MaskTable` from segmentation records.
+
+    ``records`` are the dicts yielded by
+    :func:`faultlines.segmentation.segment_images`. ``rowId``, ``panoId``
+    and the building come from the SVI file name in ``key``; they are empty
+    for keys that are not SVI names.
+    """
+    halves = {name: [] for name in HALF_ARRAYS[:-1]}
+    windows, boxes, scores, area, lengths, counts = [], [], [], [], [], []
+    for record in records:
+        fields = parse_svi_file_name(record["key"]) or {}
+        halves["key"].append(record["key"])
+        halves["rowId"].append(fields.get("rowId", ""))
+        halves["panoId"].append(fields.get("panoId", ""))
+        halves["side"].append(record["side"])
+        halves["building"].append(fields.get(f"index{record['side']}", ""))
+        halves["height"].append(record["shape"][0])
+        halves["width"].append(record["shape"][1])
+        halves["offset"].append(record["offset"])
+        windows.append(len(record["masks"]))
+        boxes.append(np.asarray(record["boxes"], dtype=np.float32).reshape(-1, 4))
+        scores.append(np.asarray(record["scores"], dtype=np.float32))
+        for mask in record["masks"]:
+            area.append(rle_area(mask))
+            lengths.append(len(mask))
+            counts.append(np.asarray(mask, dtype=RLE_DTYPE))
+
+    def offsets(sizes):
+        return np.concatenate(([0], np.cumsum(sizes, dtype=np.int64)))
+
+    return MaskTable(
+        *(np.asarray(halves[name], dtype=str) for name in ("key", "rowId", "panoId", "side", "building")),
+        np.asarray(halves["height"], dtype=np.int32),
+        np.asarray(halves["width"], dtype=np.int32),
+        np.asarray(halves["offset"], dtype=np.int32),
+        offsets(windows),
+        np.concatenate(boxes) if boxes else np.empty((0, 4), dtype=np.float32),
+        np.concatenate(scores) if scores else np.empty(0, dtype=np.float32),
+        np.asarray(area, dtype=np.int64),
+        offsets(lengths),
+        np.concatenate(counts) if counts else np.empty(0, dtype=RLE_DTYPE),
+    )
+
+
+def load_masks(path, mmap=True):
+    """Read a table written by :meth:`MaskTable.save`, memory-mapped by default."""
+    names = HALF_ARRAYS + MASK_ARRAYS
+    if not mmap:
+        with np.load(path) as data:
+            return MaskTable(*(data[name] for name in names))
+    return MaskTable(*(mmap_member(path, name) for name in names))
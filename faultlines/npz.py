@@ -0,0 +1,65 @@
+"""Memory-mapped access to uncompressed ``.npz`` archives.
+
+``np.savez`` stores every array as a raw ``.npy`` member, so an array can
+be mapped straight out of the zip file at the member's data offset. The
+graph and mask tables use this to open city-sized files without reading
+them.
+"""
+
+import os
+import zipfile
+
+import numpy as np
+
+
+def storable(values):
+    """Return ``values`` as an array ``np.load`` can read without pickle.
+
+    Object arrays (string labels, mostly) become fixed-width unicode.
+    """
+    values = np.asarray(values)
+    if values.dtype == object:
+        values = values.astype(str)
+    return values
+
+
+def save_npz(path, arrays):
+    """Write ``{name: array}`` to an uncompressed ``.npz`` file at exactly ``path``.
+
+    ``np.savez`` appends ``.npz`` to a file name without it; writing through
+    an open file keeps the name as given. The archive is written to a
+    ``.part`` file and renamed into place. Returns ``path``.
+    """
+    part = f"{path}.part"
+    with open(part, "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(part, path)
+    return path
+
+
+def mmap_member(path, name):
+    """Memory-map the array ``name`` of the uncompressed ``.npz`` file at ``path``.
+
+    Raises ``ValueError`` for a compressed archive. Empty arrays are
+    returned in memory, since a zero-length map is not allowed.
+    """
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(f"{name}.npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError(f"{path} is compressed and cannot be memory-mapped")
+
+    with open(path, "rb") as file:
+        # Skip the zip local file header to reach the raw .npy member.
+        file.seek(info.header_offset + 26)
+        name_length, extra_length = np.frombuffer(file.read(4), dtype="<u2")
+        file.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+        version = np.lib.format.read_magic(file)
+        read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                       else np.lib.format.read_array_header_2_0)
+        shape, fortran_order, dtype = read_header(file)
+        offset = file.tell()
+
+    if len(shape) and shape[0] == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape,
+                     order="F" if fortran_order else "C")
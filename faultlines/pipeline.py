@@ -0,0 +1,391 @@
+"""Headless runner for the adjacency -> index -> SVI pipeline.
+
+Replaces opening each QGIS script in turn and passing layer names such as
+``00_40192`` between them. Every block lives in its own folder under a
+root::
+
+    root/00_40192/footprints.parquet   building footprints (WKB ``geometry``, ``index``)
+    root/00_40192/streets.parquet      optional street lines (WKB ``geometry``)
+
+and each stage writes one table (or file) next to them, keyed by ``rowId``.
+A stage's fingerprint hashes its code version, its parameters and the
+fingerprints of its inputs; it is stored in ``.pipeline.json`` and a stage
+only re-runs when its fingerprint changes or its output is missing, which
+also re-runs everything downstream. Blocks are independent and fan out over
+a process pool. The footprints must be in a projected CRS, read from their
+GeoParquet metadata or given as ``crs``.
+
+Run ``python -m faultlines.pipeline ROOT [BLOCK ...]`` for the command line
+tool.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import shapely
+
+from .cache import MetadataCache
+from .download import DownloadJob, download_images
+from .geo import heading_pitch, to_lat_lon
+from .graph import build_adjacency_graph, load_graph
+from .indexing import assign_lr_index
+from .streetview import STREETVIEW_URL, StreetViewClient, svi_file_name, svi_folder_name
+from .shards import index_path
+from .tables import read_table, write_table
+from .telemetry import Telemetry
+from .walls import party_wall_points
+
+logger = logging.getLogger(__name__)
+
+STATE_NAME = ".pipeline.json"
+TELEMETRY_NAME = "telemetry.json"
+FOOTPRINTS = "footprints.parquet"
+STREETS = "streets.parquet"
+DEPTH_FOLDER = "depth"
+DEFAULTS = {
+    "crs": None,
+    "tolerance": 1.0,
+    "index_tolerance": 10.0,
+    "radius": 50,
+    "size": "640x640",
+    "fov": 90,
+    "prompt": "window",
+    "streetview_url": STREETVIEW_URL,
+}
+
+
+class Block:
+    """The folder of one block and the tables its stages exchange.
+
+    Stages time themselves and count their work on ``telemetry``.
+    """
+
+    def __init__(self, root, name):
+        self.name = name
+        self.folder = os.path.join(root, name)
+        self.telemetry = Telemetry(name)
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def geometries(self, name, columns=()):
+        """Return the Shapely geometries of the table ``name`` and its ``columns``."""
+        table = read_table(self.path(name), columns=["geometry", *columns])
+        return shapely.from_wkb(table["geometry"].to_numpy()), table
+
+    def rows(self, *names, columns=None):
+        """Join the stage tables ``names`` on ``rowId``."""
+        table = read_table(self.path(f"{names[0]}.parquet"), columns=columns and ["rowId", *columns[names[0]]])
+        for name in names[1:]:
+            other = read_table(self.path(f"{name}.parquet"), columns=columns and ["rowId", *columns[name]])
+            table = table.merge(other, on="rowId", how="left")
+        return table
+
+
+class Stage:
+    """A pipeline step: ``run(block, params)`` writes ``outputs`` inside the block folder.
+
+    ``after`` names the upstream stages, ``files`` the block input files and
+    ``params`` the parameters the result depends on. Bump ``version`` when
+    the stage's code changes its output.
+    """
+
+    def __init__(self, name, run, after=(), files=(), params=(), outputs=(), version=1):
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+        self.files = tuple(files)
+        self.params = tuple(params)
+        self.outputs = tuple(outputs) or (f"{name}.parquet",)
+        self.version = version
+
+    def fingerprint(self, block, params, upstream):
+        files = {}
+        for name in self.files:
+            path = block.path(name)
+            files[name] = [os.path.getsize(path), os.stat(path).st_mtime_ns] if os.path.exists(path) else None
+        payload = {
+            "stage": self.name,
+            "version": self.version,
+            "params": {name: params[name] for name in self.params},
+            "files": files,
+            "after": {name: upstream[name] for name in self.after},
+        }
+        return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _table(block, name, **columns):
+    import pandas as pd
+
+    frame = pd.DataFrame(columns)
+    write_table(frame, block.path(f"{name}.parquet"))
+    block.telemetry.count("rows_written", len(frame))
+
+
+def _client(block, params, **kwargs):
+    return StreetViewClient(params["api_key"], streetview_url=params["streetview_url"],
+                            telemetry=block.telemetry, **kwargs)
+
+
+def run_adjacency(block, params):
+    geoms, table = block.geometries(FOOTPRINTS, ["index"])
+    graph = build_adjacency_graph(geoms, params["tolerance"], labels=table["index"].to_numpy())
+    graph.save(block.path("adjacency.npz"))
+
+
+def run_walls(block, params):
+    geoms, _ = block.geometries(FOOTPRINTS)
+    streets = block.geometries(STREETS)[0] if os.path.exists(block.path(STREETS)) else None
+    result = party_wall_points(geoms, params["tolerance"], streets=streets,
+                               graph=load_graph(block.path("adjacency.npz")))
+    points = result["points"]
+    _table(block, "walls", rowId=np.arange(len(points)), x=shapely.get_x(points), y=shapely.get_y(points),
+           end=result["end"], length=result["length"])
+
+
+def run_index(block, params):
+    geoms, footprints = block.geometries(FOOTPRINTS, ["index"])
+    walls = block.rows("walls", columns={"walls": ["x", "y"]})
+    points = shapely.points(walls["x"].to_numpy(), walls["y"].to_numpy())
+    index_left, index_right = assign_lr_index(points, geoms, footprints["index"].to_numpy(),
+                                              tolerance=params["index_tolerance"])
+    _table(block, "index", rowId=walls["rowId"], indexL=index_left, indexR=index_right)
+
+
+def run_latlon(block, params):
+    walls = block.rows("walls", columns={"walls": ["x", "y"]})
+    lat, lon = to_lat_lon(walls["x"], walls["y"], params["crs"])
+    _table(block, "latlon", rowId=walls["rowId"], latINTP=lat, lonINTP=lon)
+
+
+def run_nearest(block, params):
+    rows = block.rows("latlon")
+    with MetadataCache() as cache, _client(block, params, cache=cache) as client:
+        results = client.nearest_panos([(lat, lon, params["radius"]) for lat, lon in
+                                        zip(rows["latINTP"], rows["lonINTP"])])
+    found = [data if data is not None and data.get("status") == "OK" else None for data in results]
+    _table(block, "nearest", rowId=rows["rowId"],
+           panoId=[data["pano_id"] if data else None for data in found],
+           latSVI=[float(data["location"]["lat"]) if data else np.nan for data in found],
+           lonSVI=[float(data["location"]["lng"]) if data else np.nan for data in found],
+           status=[data.get("status") if data is not None else None for data in results])
+
+
+def run_heading(block, params):
+    rows = block.rows("latlon", "nearest", columns={"latlon": ["latINTP", "lonINTP"], "nearest": ["latSVI", "lonSVI"]})
+    heading, pitch = heading_pitch(rows["latINTP"], rows["lonINTP"], rows["latSVI"], rows["lonSVI"])
+    _table(block, "heading", rowId=rows["rowId"], heading=heading, pitch=pitch)
+
+
+def run_download(block, params):
+    rows = block.rows("index", "latlon", "nearest", "heading")
+    rows = rows[rows["panoId"].notna()]
+    folder = block.path(svi_folder_name(block.name, params["size"], params["fov"]))
+    os.makedirs(folder, exist_ok=True)
+    with _client(block, params) as client:
+        jobs = [DownloadJob(row.rowId, client.image_url(row.panoId, params["size"], params["fov"], row.heading, row.pitch),
+                            os.path.join(folder, svi_file_name(row.rowId, row.panoId, row.latINTP, row.lonINTP,
+                                                               row.indexL, row.indexR)))
+                for row in rows.itertuples()]
+        paths = download_images(client, jobs)
+    _table(block, "download", rowId=rows["rowId"], filepath=paths)
+
+
+def run_depth(block, params):
+    from .depth import process_folder
+
+    folder = block.path(svi_folder_name(block.name, params["size"], params["fov"]))
+    process_folder(folder, block.path(DEPTH_FOLDER), output="raw")
+
+
+def run_segment(block, params):
+    from .masks import mask_table
+    from .segmentation import FacadeSegmenter, segment_images
+
+    folder = block.path(svi_folder_name(block.name, params["size"], params["fov"]))
+    segmenter = FacadeSegmenter.from_pretrained(params["prompt"])
+    mask_table(segment_images(segmenter, folder)).save(block.path("masks.npz"))
+
+
+STAGES = [
+    Stage("adjacency", run_adjacency, files=[FOOTPRINTS], params=["tolerance"], outputs=["adjacency.npz"]),
+    Stage("walls", run_walls, after=["adjacency"], files=[FOOTPRINTS, STREETS], params=["tolerance"]),
+    Stage("index", run_index, after=["walls"], files=[FOOTPRINTS], params=["index_tolerance"]),
+    Stage("latlon", run_latlon, after=["walls"], params=["crs"]),
+    Stage("nearest", run_nearest, after=["latlon"], params=["radius"]),
+    Stage("heading", run_heading, after=["latlon", "nearest"]),
+    Stage("download", run_download, after=["index", "latlon", "nearest", "heading"], params=["size", "fov"]),
+    # process_folder keeps raw depth under the "depth" prefix of its output folder.
+    Stage("depth", run_depth, after=["download"], outputs=[os.path.join(DEPTH_FOLDER, index_path("depth"))]),
+    Stage("segment", run_segment, after=["download"], params=["prompt"], outputs=["masks.npz"]),
+]
+STAGE_NAMES = [stage.name for stage in STAGES]
+
+
+def required_stages(targets):
+    """Return the stages needed for ``targets``, in pipeline order."""
+    by_name = {stage.name: stage for stage in STAGES}
+    needed, pending = set(), list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in needed:
+            needed.add(name)
+            pending.extend(by_name[name].after)
+    return [stage for stage in STAGES if stage.name in needed]
+
+
+def load_state(block):
+    path = block.path(STATE_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_state(block, state):
+    part = block.path(f"{STATE_NAME}.part")
+    with open(part, "w") as file:
+        json.dump(state, file, indent=2)
+    os.replace(part, block.path(STATE_NAME))
+
+
+def footprint_crs(block):
+    """Return the CRS in the GeoParquet metadata of the block's footprints, or ``None``.
+
+    Following the GeoParquet spec an omitted ``crs`` means ``OGC:CRS84``;
+    a file without ``geo`` metadata, or with ``"crs": null``, has no known CRS.
+    """
+    import pyarrow.parquet as pq
+
+    metadata = pq.read_schema(block.path(FOOTPRINTS)).metadata or {}
+    if b"geo" not in metadata:
+        return None
+    geo = json.loads(metadata[b"geo"])
+    return geo.get("columns", {}).get(geo.get("primary_column", "geometry"), {}).get("crs", "OGC:CRS84")
+
+
+def resolve_crs(block, crs=None):
+    """Return the projected CRS of the block's footprints as ``"AUTH:CODE"`` (or WKT).
+
+    ``crs`` overrides the CRS stored with the footprints and is required
+    when there is none. The tolerances are in metres, so a geographic CRS
+    raises ``ValueError``.
+    """
+    from pyproj import CRS
+
+    stored = footprint_crs(block)
+    if crs is None and stored is None:
+        raise ValueError(f"{block.name}: {FOOTPRINTS} does not record its CRS; pass --crs")
+    resolved = CRS.from_user_input(stored if crs is None else crs)
+    if crs is not None and stored is not None and CRS.from_user_input(stored) != resolved:
+        logger.warning("%s: --crs %s overrides the footprints' CRS %s", block.name, crs,
+                       CRS.from_user_input(stored).to_string())
+    if resolved.is_geographic:
+        raise ValueError(f"{block.name}: footprints are in geographic degrees ({resolved.to_string()}) "
+                         f"but the tolerances are in metres; reproject them to a projected CRS")
+    unit = resolved.axis_info[0].unit_name if resolved.axis_info else None
+    if unit not in ("metre", None):
+        logger.warning("%s: %s is in %s, not metres; the tolerances are applied in %s",
+                       block.name, resolved.to_string(), unit, unit)
+    authority = resolved.to_authority()
+    return ":".join(authority) if authority else resolved.to_wkt()
+
+
+def run_block(root, name, targets=("download",), params=None, force=(), dry_run=False):
+    """Bring the ``targets`` stages of block ``name`` up to date.
+
+    Returns ``{stage: status}`` with ``"ran"``, ``"fresh"`` (already up to
+    date) or ``"stale"`` (would run, with ``dry_run``). Stages named in
+    ``force`` run regardless of their fingerprint.
+    """
+    params = dict(DEFAULTS, **{"api_key": None, **(params or {})})
+    block = Block(root, name)
+    params["crs"] = resolve_crs(block, params["crs"])
+    state = load_state(block)
+    fingerprints, statuses = {}, {}
+    for stage in required_stages(targets):
+        fingerprint = stage.fingerprint(block, params, fingerprints)
+        fingerprints[stage.name] = fingerprint
+        fresh = (stage.name not in force and state.get(stage.name, {}).get("fingerprint") == fingerprint
+                 and all(os.path.exists(block.path(output)) for output in stage.outputs))
+        if fresh or dry_run:
+            statuses[stage.name] = "fresh" if fresh else "stale"
+            continue
+
+        logger.info("%s: running %s", name, stage.name)
+        with block.telemetry.stage(stage.name):
+            stage.run(block, params)
+        timer = block.telemetry.stages()[stage.name]
+        state[stage.name] = {"fingerprint": fingerprint, "seconds": round(timer["wall_seconds"], 3),
+                             "cpu_seconds": round(timer["cpu_seconds"], 3), "finished": time.time()}
+        save_state(block, state)
+        statuses[stage.name] = "ran"
+    if "ran" in statuses.values():
+        block.telemetry.save(block.path(TELEMETRY_NAME))
+    return statuses
+
+
+def _run_block(args):
+    root, name, kwargs = args
+    try:
+        return name, run_block(root, name, **kwargs), None
+    except Exception as e:
+        logger.exception("%s failed", name)
+        return name, None, f"{type(e).__name__}: {e}"
+
+
+def run_blocks(root, blocks, workers=None, **kwargs):
+    """Run :func:`run_block` for every block name, ``workers`` blocks at a time.
+
+    Returns ``{block: (statuses, error)}``; a failing block does not stop
+    the others.
+    """
+    tasks = [(root, name, kwargs) for name in blocks]
+    if workers == 1 or len(tasks) <= 1:
+        return {name: (statuses, error) for name, statuses, error in map(_run_block, tasks)}
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for future in as_completed([pool.submit(_run_block, task) for task in tasks]):
+            name, statuses, error = future.result()
+            results[name] = (statuses, error)
+    return results
+
+
+def find_blocks(root):
+    """Return the names of the folders of ``root`` holding a footprints table."""
+    return sorted(name for name in os.listdir(root) if os.path.exists(os.path.join(root, name, FOOTPRINTS)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the FaultLines pipeline over block folders.")
+    parser.add_argument("root", help="folder holding one sub-folder per block")
+    parser.add_argument("blocks", nargs="*", help="block names (default: every block under root)")
+    parser.add_argument("--until", nargs="+", default=["download"], choices=STAGE_NAMES,
+                        help="stages to bring up to date, with everything they depend on")
+    parser.add_argument("--force", nargs="*", default=[], choices=STAGE_NAMES, help="stages to re-run regardless")
+    parser.add_argument("--workers", type=int, default=None, help="blocks processed in parallel")
+    parser.add_argument("--dry-run", action="store_true", help="only report which stages are stale")
+    parser.add_argument("--api-key", default=os.environ.get("GOOGLE_MAPS_API_KEY"))
+    for name, value in DEFAULTS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=str if value is None else type(value), default=value)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    params = {name: getattr(args, name) for name in DEFAULTS}
+    params["api_key"] = args.api_key
+    results = run_blocks(args.root, args.blocks or find_blocks(args.root), workers=args.workers,
+                         targets=args.until, params=params, force=args.force, dry_run=args.dry_run)
+    for name in sorted(results):
+        statuses, error = results[name]
+        print(f"{name}: {error}" if error else f"{name}: " + ", ".join(f"{k}={v}" for k, v in statuses.items()))
+    return 1 if any(error for _, error in results.values()) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,221 @@
+"""Batched text-prompted facade segmentation of SVI halves.
+
+Scriptable replacement for ``process_image`` in ``00_SS_FaultLines.ipynb``.
+Like LangSAM, a text prompt (``"window"``) is grounded to boxes with
+GroundingDINO and the boxes are turned into masks with SAM. Every SVI is
+split into its left and right halves as before, but halves from many images
+go through both models as one batch. The prompt is tokenized and
+text-encoded once and the encoding is reused for every batch, and SAM's
+image encoder runs once per batch with only the light mask decoder run per
+half. Masks come out run-length encoded and are collected into one
+:class:`~faultlines.masks.MaskTable` file.
+
+Run ``python -m faultlines.segmentation INPUT OUTPUT`` for the command line
+tool.
+"""
+
+import argparse
+import collections
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from PIL import Image
+from transformers.modeling_outputs import BaseModelOutput
+
+from .masks import mask_table, rle_encode
+from .shards import ShardReader, index_path, list_images
+
+logger = logging.getLogger(__name__)
+
+GDINO_MODEL = "IDEA-Research/grounding-dino-base"
+SAM_MODEL = "facebook/sam-vit-base"
+DEFAULT_PROMPT = "window"
+# LangSAM's defaults.
+BOX_THRESHOLD = 0.3
+TEXT_THRESHOLD = 0.25
+SIDES = ("L", "R")
+
+
+def split_image(image):
+    """Return the left and right halves of ``image``, as the notebook did."""
+    width, height = image.size
+    return image.crop((0, 0, width // 2, height)), image.crop((width // 2, 0, width, height))
+
+
+class CachedTextBackbone(torch.nn.Module):
+    """Text encoder that encodes each distinct prompt once.
+
+    GroundingDINO re-encodes the prompt for every image of every batch.
+    When all rows of a batch hold the same prompt, this wrapper encodes a
+    single row, keeps the result, and broadcasts it over the batch.
+    """
+
+    def __init__(self, backbone):
+        super().__init__()
+        self.backbone = backbone
+        self.cache = {}
+
+    def forward(self, input_ids, attention_mask=None, token_type_ids=None, position_ids=None,
+                return_dict=True, **kwargs):
+        if not bool((input_ids == input_ids[:1]).all()):
+            return self.backbone(input_ids, attention_mask, token_type_ids, position_ids,
+                                 return_dict=return_dict, **kwargs)
+        key = (tuple(input_ids[0].tolist()), input_ids.device)
+        hidden = self.cache.get(key)
+        if hidden is None:
+            hidden = self.backbone(input_ids[:1], attention_mask[:1], token_type_ids[:1], position_ids[:1],
+                                   return_dict=True).last_hidden_state
+            self.cache[key] = hidden
+        hidden = hidden.expand(len(input_ids), -1, -1)
+        return BaseModelOutput(last_hidden_state=hidden) if return_dict else (hidden,)
+
+
+class FacadeSegmenter:
+    """Prompted box detection (GroundingDINO) and box-to-mask (SAM) on image batches."""
+
+    def __init__(self, gdino, gdino_processor, sam, sam_processor, prompt=DEFAULT_PROMPT, device="cpu",
+                 box_threshold=BOX_THRESHOLD, text_threshold=TEXT_THRESHOLD):
+        self.device = device
+        self.gdino = gdino.to(device).eval()
+        self.gdino_processor = gdino_processor
+        self.sam = sam.to(device).eval()
+        self.sam_processor = sam_processor
+        self.box_threshold = box_threshold
+        self.text_threshold = text_threshold
+
+        if not isinstance(self.gdino.model.text_backbone, CachedTextBackbone):
+            self.gdino.model.text_backbone = CachedTextBackbone(self.gdino.model.text_backbone)
+        # GroundingDINO expects lower-case phrases terminated by a period.
+        prompt = prompt.lower().strip()
+        self.prompt = prompt if prompt.endswith(".") else f"{prompt}."
+        self.text = {name: value.to(device) for name, value in
+                     gdino_processor.tokenizer([self.prompt], return_tensors="pt").items()}
+
+    @classmethod
+    def from_pretrained(cls, prompt=DEFAULT_PROMPT, device="cpu", gdino=GDINO_MODEL, sam=SAM_MODEL, **kwargs):
+        """Load both models once from the Hugging Face hub."""
+        from transformers import AutoModelForZeroShotObjectDetection, AutoProcessor, SamModel, SamProcessor
+
+        return cls(AutoModelForZeroShotObjectDetection.from_pretrained(gdino), AutoProcessor.from_pretrained(gdino),
+                   SamModel.from_pretrained(sam), SamProcessor.from_pretrained(sam),
+                   prompt=prompt, device=device, **kwargs)
+
+    def segment(self, images):
+        """Return the detections of each image in ``images``.
+
+        Images are split into halves. The result holds one ``(left, right)``
+        pair per image. Each half is a dict with the ``boxes`` (``(n, 4)``
+        ``xyxy`` in half coordinates), ``scores``, ``labels``, ``masks`` (RLE
+        counts, see :func:`~faultlines.masks.rle_decode`) and ``shape`` of
+        the half.
+        """
+        halves = [half for image in images for half in split_image(image)]
+        if not halves:
+            return []
+        sizes = [half.size[::-1] for half in halves]
+
+        with torch.inference_mode():
+            pixels = self.gdino_processor.image_processor(halves, return_tensors="pt")
+            text = {name: value.expand(len(halves), -1) for name, value in self.text.items()}
+            outputs = self.gdino(pixel_values=pixels["pixel_values"].to(self.device),
+                                 pixel_mask=pixels["pixel_mask"].to(self.device), **text)
+            detections = self.gdino_processor.post_process_grounded_object_detection(
+                outputs, text["input_ids"], threshold=self.box_threshold,
+                text_threshold=self.text_threshold, target_sizes=sizes)
+
+            sam_inputs = self.sam_processor.image_processor(halves, return_tensors="pt")
+            embeddings = self.sam.get_image_embeddings(sam_inputs["pixel_values"].to(self.device))
+
+            results = []
+            for i, detection in enumerate(detections):
+                boxes = detection["boxes"].float().cpu()
+                masks = []
+                if len(boxes):
+                    height, width = sizes[i]
+                    resized_height, resized_width = sam_inputs["reshaped_input_sizes"][i].tolist()
+                    scale = torch.tensor([resized_width / width, resized_height / height] * 2)
+                    predicted = self.sam(image_embeddings=embeddings[i:i + 1],
+                                         input_boxes=(boxes * scale)[None].to(self.device),
+                                         multimask_output=False).pred_masks
+                    masks = self.sam_processor.image_processor.post_process_masks(
+                        predicted.cpu(), sam_inputs["original_sizes"][i:i + 1],
+                        sam_inputs["reshaped_input_sizes"][i:i + 1])[0][:, 0].numpy()
+                results.append({
+                    "boxes": boxes.numpy(),
+                    "scores": detection["scores"].float().cpu().numpy(),
+                    "labels": list(detection.get("text_labels", detection.get("labels", []))),
+                    "masks": [rle_encode(mask) for mask in masks],
+                    "shape": sizes[i],
+                })
+        return list(zip(results[::2], results[1::2]))
+
+
+def _load(path):
+    return os.path.splitext(os.path.basename(path))[0], Image.open(path).convert("RGB")
+
+
+def image_batches(source, batch_size=8, workers=4, prefetch=2):
+    """Yield ``(keys, images)`` batches from a folder, shard prefix or list of paths.
+
+    Decoding runs on ``workers`` threads, up to ``prefetch`` batches ahead.
+    """
+    if isinstance(source, str) and os.path.exists(index_path(source)):
+        yield from ShardReader(source).batches(batch_size, workers=workers, prefetch=prefetch)
+        return
+
+    paths = list_images(source) if isinstance(source, str) else list(source)
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(paths), batch_size):
+            pending.append([pool.submit(_load, path) for path in paths[start:start + batch_size]])
+            if len(pending) > prefetch:
+                yield tuple(map(list, zip(*(future.result() for future in pending.popleft()))))
+        while pending:
+            yield tuple(map(list, zip(*(future.result() for future in pending.popleft()))))
+
+
+def segment_images(segmenter, source, batch_size=8, workers=4, prefetch=2, progress=None, should_stop=None):
+    """Yield one record per image half of ``source``.
+
+    Records hold the image ``key``, its ``side`` (``"L"`` or ``"R"``), the
+    pixel ``offset`` of the half in the full image and the fields returned
+    by :meth:`FacadeSegmenter.segment`. ``progress`` is called with the
+    number of images done after each batch and ``should_stop`` is checked
+    before each batch.
+    """
+    done = 0
+    for keys, images in image_batches(source, batch_size, workers, prefetch):
+        if should_stop is not None and should_stop():
+            return
+        for key, image, halves in zip(keys, images, segmenter.segment(images)):
+            for side, offset, half in zip(SIDES, (0, image.size[0] // 2), halves):
+                yield dict(half, key=key, side=side, offset=offset)
+        done += len(keys)
+        if progress is not None:
+            progress(done)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batched text-prompted segmentation of SVI halves.")
+    parser.add_argument("input", help="image folder or shard prefix")
+    parser.add_argument("output", help="mask table (.npz) to write")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--batch-size", type=int, default=8, help="images per batch (twice as many halves)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--box-threshold", type=float, default=BOX_THRESHOLD)
+    parser.add_argument("--text-threshold", type=float, default=TEXT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    segmenter = FacadeSegmenter.from_pretrained(args.prompt, args.device, box_threshold=args.box_threshold,
+                                                text_threshold=args.text_threshold)
+    table = mask_table(segment_images(segmenter, args.input, args.batch_size, args.workers))
+    table.save(args.output)
+    logger.info("Segmented %d halves (%d masks) into %s", len(table), table.mask_count, args.output)
+
+
+if __name__ == "__main__":
+    main()
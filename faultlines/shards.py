@@ -0,0 +1,195 @@
+"""Packed SVI image shards.
+
+Hundreds of thousands of small JPEGs are packed into WebDataset-style tar
+shards (``prefix-000000.tar``, ...) plus one ``prefix.index.jsonl`` index
+recording the shard, byte offset and size of every image. Readers then
+stream large sequential blocks instead of opening every file, and can still
+jump to a single image through the index.
+"""
+
+import io
+import json
+import os
+import queue
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+SHARD_MAX_COUNT = 10_000
+SHARD_MAX_BYTES = 1 << 30
+READ_BUFFER = 8 << 20
+
+
+def index_path(prefix):
+    """Return the index file of the shard set ``prefix``."""
+    return f"{prefix}.index.jsonl"
+
+
+def list_images(folder):
+    """Return the sorted paths of the images directly inside ``folder``."""
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+class ShardWriter:
+    """Write images into size-bounded tar shards and index them.
+
+    A shard is closed once it holds ``max_count`` images or ``max_bytes``
+    bytes. Use as a context manager so the last shard and the index are
+    flushed.
+    """
+
+    def __init__(self, prefix, max_count=SHARD_MAX_COUNT, max_bytes=SHARD_MAX_BYTES):
+        self.prefix = prefix
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.shard = -1
+        self.tar = None
+        self.count = 0
+        self.bytes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+        self.index = open(index_path(prefix), 'w')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _next_shard(self):
+        if self.tar is not None:
+            self.tar.close()
+        self.shard += 1
+        self.count = 0
+        self.bytes = 0
+        self.tar = tarfile.open(f"{self.prefix}-{self.shard:06d}.tar", 'w')
+
+    def write(self, key, data, extension='.jpg'):
+        """Append the encoded image ``data`` under ``key``."""
+        if self.tar is None or self.count >= self.max_count or self.bytes + len(data) > self.max_bytes:
+            self._next_shard()
+        info = tarfile.TarInfo(f"{key}{extension}")
+        info.size = len(data)
+        # The data follows the member header, which grows for long names.
+        offset = self.tar.offset + len(info.tobuf(self.tar.format, self.tar.encoding, self.tar.errors))
+        self.tar.addfile(info, io.BytesIO(data))
+        self.index.write(json.dumps({'key': key, 'shard': self.shard, 'offset': offset,
+                                     'size': len(data), 'ext': extension}) + '\n')
+        self.count += 1
+        self.bytes += len(data)
+
+    def close(self):
+        if self.tar is not None:
+            self.tar.close()
+            self.tar = None
+        self.index.close()
+
+
+def pack_folder(folder, prefix, **kwargs):
+    """Pack every image of ``folder`` into shards at ``prefix``; return the image count."""
+    paths = list_images(folder)
+    with ShardWriter(prefix, **kwargs) as writer:
+        for path in paths:
+            key, extension = os.path.splitext(os.path.basename(path))
+            with open(path, 'rb') as file:
+                writer.write(key, file.read(), extension)
+    return len(paths)
+
+
+def decode_image(data):
+    """Decode encoded image bytes into an RGB PIL image."""
+    from PIL import Image
+
+    return Image.open(io.BytesIO(data)).convert("RGB")
+
+
+class ShardReader:
+    """Read images back from a shard set written by :class:`ShardWriter`."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        with open(index_path(prefix)) as file:
+            self.entries = [json.loads(line) for line in file]
+        self.positions = {entry['key']: i for i, entry in enumerate(self.entries)}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def keys(self):
+        return [entry['key'] for entry in self.entries]
+
+    def shard_path(self, shard):
+        return f"{self.prefix}-{shard:06d}.tar"
+
+    def read(self, key):
+        """Return the encoded bytes of one image through the index."""
+        entry = self.entries[self.positions[key]]
+        with open(self.shard_path(entry['shard']), 'rb') as file:
+            file.seek(entry['offset'])
+            return file.read(entry['size'])
+
+    def __iter__(self):
+        """Yield ``(key, bytes)`` for every image, reading each shard sequentially."""
+        shard, file = None, None
+        try:
+            for entry in self.entries:
+                if entry['shard'] != shard:
+                    if file is not None:
+                        file.close()
+                    shard = entry['shard']
+                    file = open(self.shard_path(shard), 'rb', buffering=READ_BUFFER)
+                file.seek(entry['offset'])
+                yield entry['key'], file.read(entry['size'])
+        finally:
+            if file is not None:
+                file.close()
+
+    def batches(self, batch_size=32, decode=True, workers=4, prefetch=2):
+        """Yield ``(keys, images)`` batches, decoding on ``workers`` threads.
+
+        Reading and decoding run ahead of the consumer by up to
+        ``prefetch`` batches. ``images`` are RGB PIL images, or the raw bytes
+        when ``decode`` is false.
+        """
+        ready = queue.Queue(maxsize=max(1, prefetch))
+        done = object()
+        stop = threading.Event()
+
+        def produce():
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    keys, blobs = [], []
+                    for key, data in self:
+                        if stop.is_set():
+                            return
+                        keys.append(key)
+                        blobs.append(data)
+                        if len(keys) == batch_size:
+                            ready.put((keys, list(pool.map(decode_image, blobs)) if decode else blobs))
+                            keys, blobs = [], []
+                    if keys:
+                        ready.put((keys, list(pool.map(decode_image, blobs)) if decode else blobs))
+            except Exception as e:
+                ready.put(e)
+            finally:
+                ready.put(done)
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = ready.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            # Drain so a blocked producer can observe the stop flag and exit.
+            while thread.is_alive():
+                try:
+                    ready.get(timeout=0.1)
+                except queue.Empty:
+                    pass
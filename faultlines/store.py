@@ -0,0 +1,162 @@
+"""Content-addressed Street View image store.
+
+An image is fully determined by its request ``(panoId, heading, pitch, fov,
+size)``, so blobs are stored under the hash of that key and shared by every
+row (and every size/fov folder) that asks for the same view. A SQLite
+manifest maps each row to its blob; :meth:`ImageStore.materialize` rebuilds
+the familiar ``SVI-rowId-panoId-...jpg`` folders as hard links.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+
+from .download import DownloadJob, download_images, is_valid_image
+from .streetview import svi_file_name
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.sqlite"
+# A download's .part file is left alone by gc until it is this old.
+PART_GRACE = 3600
+
+
+def blob_key(pano_id, heading, pitch, fov, size):
+    """Return the hex digest addressing one image request.
+
+    Angles are rounded to 1e-6 degrees so float noise does not split blobs.
+    """
+    canonical = f"{pano_id}|{float(heading):.6f}|{float(pitch):.6f}|{int(float(fov))}|{size}"
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+class ImageStore:
+    """Image blobs under ``root/blobs`` plus a row -> blob manifest."""
+
+    def __init__(self, root):
+        self.root = root
+        self.blob_root = os.path.join(root, "blobs")
+        os.makedirs(self.blob_root, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(root, MANIFEST_NAME))
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            " collection TEXT NOT NULL, rowId TEXT NOT NULL, blob TEXT NOT NULL, name TEXT NOT NULL,"
+            " panoId TEXT, heading REAL, pitch REAL, fov INTEGER, size TEXT,"
+            " PRIMARY KEY (collection, rowId))"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS rows_blob ON rows (blob)")
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def blob_path(self, key):
+        """Return the file path of blob ``key``."""
+        return os.path.join(self.blob_root, key[:2], f"{key}.jpg")
+
+    def add_rows(self, collection, rows, size, fov):
+        """Register ``rows`` under ``collection`` and return their blob keys.
+
+        ``rows`` are mappings with the ``rowId``, ``panoId``, ``heading``,
+        ``pitch``, ``latINTP``, ``lonINTP``, ``indexL`` and ``indexR`` fields.
+        """
+        keys, records = [], []
+        for row in rows:
+            key = blob_key(row['panoId'], row['heading'], row['pitch'], fov, size)
+            name = svi_file_name(row['rowId'], row['panoId'], row['latINTP'], row['lonINTP'],
+                                 row['indexL'], row['indexR'])
+            keys.append(key)
+            records.append((collection, str(row['rowId']), key, name, row['panoId'],
+                            float(row['heading']), float(row['pitch']), int(float(fov)), size))
+        self.db.executemany("INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", records)
+        self.db.commit()
+        return keys
+
+    def fetch(self, client, collection, rows, size, fov, **kwargs):
+        """Make sure every row's image is stored; return each row's blob path or ``None``.
+
+        Only one request per distinct, missing blob is sent. Extra keyword
+        arguments go to :func:`~faultlines.download.download_images`.
+        """
+        rows = list(rows)
+        keys = self.add_rows(collection, rows, size, fov)
+
+        jobs, seen = [], set()
+        for row, key in zip(rows, keys):
+            if key in seen:
+                continue
+            seen.add(key)
+            path = self.blob_path(key)
+            if not is_valid_image(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                url = client.image_url(row['panoId'], size, fov, row['heading'], row['pitch'])
+                jobs.append(DownloadJob(key, url, path))
+        logger.info("%d rows map to %d blobs, %d to download", len(rows), len(seen), len(jobs))
+
+        kwargs.setdefault('journal_path', os.path.join(self.root, ".download_journal.jsonl"))
+        download_images(client, jobs, **kwargs)
+        return [path if is_valid_image(path) else None for path in map(self.blob_path, keys)]
+
+    def materialize(self, collection, folder):
+        """Expose ``collection`` as ``folder/SVI-...jpg`` hard links; return ``{rowId: path}``.
+
+        Falls back to copying where hard links are not supported.
+        """
+        os.makedirs(folder, exist_ok=True)
+        paths = {}
+        for row_id, key, name in self.db.execute("SELECT rowId, blob, name FROM rows WHERE collection = ?",
+                                                 (collection,)):
+            source = self.blob_path(key)
+            if not os.path.exists(source):
+                continue
+            target = os.path.join(folder, name)
+            if not os.path.exists(target):
+                try:
+                    os.link(source, target)
+                except OSError:
+                    with open(source, 'rb') as src, open(target, 'wb') as dst:
+                        dst.write(src.read())
+            paths[row_id] = target
+        return paths
+
+    def gc(self, part_grace=PART_GRACE):
+        """Delete blobs no manifest row refers to; return how many were removed.
+
+        ``.part`` files belong to downloads in progress and are only removed
+        once untouched for ``part_grace`` seconds, as left over by a run
+        that was killed.
+        """
+        referenced = {key for key, in self.db.execute("SELECT DISTINCT blob FROM rows")}
+        stale = time.time() - part_grace
+        removed = 0
+        for prefix in os.listdir(self.blob_root):
+            directory = os.path.join(self.blob_root, prefix)
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if name.endswith(".part"):
+                    try:
+                        collect = os.path.getmtime(path) < stale
+                    except FileNotFoundError:
+                        # The download finished and renamed it meanwhile.
+                        continue
+                else:
+                    collect = name[:-len(".jpg")] not in referenced
+                if collect:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+    def stats(self):
+        """Return the number of rows, distinct blobs and bytes stored."""
+        rows, blobs = self.db.execute("SELECT COUNT(*), COUNT(DISTINCT blob) FROM rows").fetchone()
+        size = sum(entry.stat().st_size for prefix in os.scandir(self.blob_root)
+                   for entry in os.scandir(prefix.path))
+        return {"rows": rows, "blobs": blobs, "bytes": size}
@@ -0,0 +1,425 @@
+"""Google Street View API helpers.
+
+Ports of the request code shared by ``QGIS/nearestSVI.py``,
+``QGIS/getNearestSVIFL.py`` and ``QGIS/downloadSVI.py``. Failed requests are
+logged and reported as ``None`` so callers can decide how to surface them.
+
+:class:`StreetViewClient` keeps one pooled HTTP session per run, limits the
+request rate with a token bucket, retries throttled and failed requests
+with exponential backoff and fans batches out over a thread pool. The
+module-level functions are one-shot shortcuts over it.
+"""
+
+import logging
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .download import DownloadJob, fetch
+from .telemetry import count
+
+logger = logging.getLogger(__name__)
+
+TILE_URL = "https://tile.googleapis.com/v1"
+STREETVIEW_URL = "https://maps.googleapis.com/maps/api/streetview"
+HEADERS = {'Content-Type': 'application/json'}
+
+# Street View Static API default quota is 30,000 requests per minute.
+DEFAULT_RATE = 500
+DEFAULT_CONCURRENCY = 16
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# The Map Tiles API accepts up to 100 locations per panoIds request.
+PANO_IDS_BATCH = 100
+# Items submitted per thread between progress updates and stop checks.
+MAP_CHUNK = 4
+SVI_NAME = re.compile(r"^SVI-(?P<rowId>[^-]+)-(?P<panoId>.+)-(?P<latINTP>-?\d+(?:\.\d+)?)"
+                      r"-(?P<lonINTP>-?\d+(?:\.\d+)?)-(?P<indexL>[^-]*)-(?P<indexR>[^-]*?)(?:\.jpg)?$")
+
+
+class RateLimiter:
+    """Thread-safe token bucket allowing ``rate`` requests per second.
+
+    Up to ``burst`` requests may start back to back after an idle period.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and take it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class StreetViewClient:
+    """Pooled, rate-limited client for the Street View and Map Tiles APIs.
+
+    ``tile_url`` and ``streetview_url`` can point at a local mock server.
+    ``rate`` is in requests per second (``None`` disables limiting) and
+    ``concurrency`` sizes both the connection pool and the thread pool used
+    by the batch methods. With a :class:`~faultlines.cache.MetadataCache`
+    as ``cache``, metadata and pano ID lookups are answered from disk when
+    possible and successful answers are stored there. With a
+    :class:`~faultlines.telemetry.Telemetry` as ``telemetry``, API calls,
+    retries, cache hits and downloaded bytes are counted on it.
+    """
+
+    def __init__(self, api_key, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, retries=4,
+                 backoff=0.5, timeout=30, tile_url=TILE_URL, streetview_url=STREETVIEW_URL, cache=None, telemetry=None):
+        self.api_key = api_key
+        self.cache = cache
+        self.telemetry = telemetry
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.tile_url = tile_url.rstrip('/')
+        self.streetview_url = streetview_url.rstrip('/')
+        self.limiter = RateLimiter(rate) if rate else None
+        self.session_token = None
+        self.session_lock = threading.Lock()
+
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=concurrency)
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.http.close()
+
+    def request(self, method, url, **kwargs):
+        """Send a request with rate limiting and retries.
+
+        Returns the final response, or ``None`` when the server could not
+        be reached at all.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        response = None
+        for attempt in range(self.retries + 1):
+            if self.limiter is not None:
+                self.limiter.acquire()
+            count(self.telemetry, 'api_calls')
+            if attempt:
+                count(self.telemetry, 'retries')
+            try:
+                response = self.http.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                logger.debug("Request to %s failed: %s", url, e)
+                response = None
+            else:
+                if response.status_code not in RETRY_STATUS:
+                    return response
+
+            if attempt < self.retries:
+                delay = self._retry_delay(response, attempt)
+                if response is not None:
+                    # A discarded (possibly streamed) response holds its pooled connection until closed.
+                    response.close()
+                time.sleep(delay)
+        return response
+
+    def _retry_delay(self, response, attempt):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff * 2 ** attempt * (1 + random.random() / 2)
+
+    def map(self, function, items, progress=None, should_stop=None, default=None):
+        """Call ``function`` on every item concurrently; results keep input order.
+
+        Items are submitted ``MAP_CHUNK`` per thread at a time. Between
+        chunks ``progress`` is called with ``(done, total)`` and
+        ``should_stop`` is checked, both on the calling thread, so they may
+        update a GUI. Items left when ``should_stop`` is true get ``default``.
+        """
+        items = list(items)
+        results = [default] * len(items)
+        chunk = self.concurrency * MAP_CHUNK
+        pool = ThreadPoolExecutor(max_workers=self.concurrency) if self.concurrency > 1 and len(items) > 1 else None
+        try:
+            for start in range(0, len(items), chunk):
+                if should_stop is not None and should_stop():
+                    break
+                part = items[start:start + chunk]
+                results[start:start + len(part)] = pool.map(function, part) if pool else [function(item) for item in part]
+                if progress is not None:
+                    progress(start + len(part), len(items))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return results
+
+    def get_session_token(self):
+        """Create a Map Tiles API street view session and return its token."""
+        url = f"{self.tile_url}/createSession"
+        payload = {
+            "mapType": "streetview",
+            "language": "en-US",
+            "region": "US"
+        }
+        response = self.request('POST', url, params={'key': self.api_key}, json=payload, headers=HEADERS)
+        if response is not None and response.status_code == 200:
+            self.session_token = response.json().get('session')
+            return self.session_token
+        logger.error("Error getting session token: %s", _describe(response))
+        return None
+
+    def ensure_session(self):
+        """Create the tiles session once, even when called from several threads."""
+        with self.session_lock:
+            if self.session_token is None:
+                self.get_session_token()
+            return self.session_token is not None
+
+    def pano_location(self, pano_id):
+        """Return the ``(lat, lng)`` of a panorama, or ``(None, None)``."""
+        if self.cache is not None:
+            cached = self.cache.get('pano', pano_id)
+            if cached is not None:
+                count(self.telemetry, 'cache_hits')
+                return cached['lat'], cached['lng']
+
+        url = f"{self.streetview_url}/metadata"
+        response = self.request('GET', url, params={'pano': pano_id, 'key': self.api_key}, headers=HEADERS)
+        if response is not None and response.status_code == 200:
+            data = response.json()
+            lat = data.get('location', {}).get('lat')
+            lng = data.get('location', {}).get('lng')
+            if self.cache is not None and lat is not None and lng is not None:
+                self.cache.set('pano', pano_id, {'lat': lat, 'lng': lng})
+            return lat, lng
+        logger.warning("Error retrieving pano location for panoID: %s", pano_id)
+        return None, None
+
+    def pano_locations(self, pano_ids, progress=None, should_stop=None):
+        """Return :meth:`pano_location` for every pano ID, concurrently.
+
+        ``progress`` and ``should_stop`` are passed to :meth:`map`.
+        """
+        return self.map(self.pano_location, pano_ids, progress=progress, should_stop=should_stop,
+                        default=(None, None))
+
+    def panorama_ids(self, lat, lng, radius=50):
+        """Return the pano IDs near ``lat``/``lng``, or ``None`` on API error."""
+        return self.panorama_ids_batch([(lat, lng)], radius=radius)[0]
+
+    def panorama_ids_batch(self, locations, radius=50, batch_size=PANO_IDS_BATCH, progress=None, should_stop=None):
+        """Return the pano IDs near every ``(lat, lng)`` in ``locations``.
+
+        Locations missing from the cache are packed ``batch_size`` to a
+        ``panoIds`` request and the answers are mapped back by position. A
+        failed request is split in half and retried until single locations
+        remain; the entries of locations that still fail, or were never
+        requested because ``should_stop`` returned true, are ``None``.
+        ``progress`` is called with ``(locations done, total)``.
+        """
+        locations = list(locations)
+        results = [None] * len(locations)
+        keys = [self.cache.location_key(lat, lng, radius) for lat, lng in locations] if self.cache is not None else None
+        if keys is not None:
+            cached = self.cache.get_many('panoIds', set(keys))
+            count(self.telemetry, 'cache_hits', len(cached))
+            for i, key in enumerate(keys):
+                results[i] = cached.get(key)
+
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending or not self.ensure_session():
+            return results
+
+        cached = len(locations) - len(pending)
+        batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+        report = None if progress is None else (
+            lambda done, total: progress(cached + min(done * batch_size, len(pending)), len(locations)))
+        for batch in self.map(lambda batch: self._pano_ids_split(locations, batch, radius), batches,
+                              progress=report, should_stop=should_stop, default=()):
+            for i, pano_ids in batch:
+                results[i] = pano_ids
+
+        if keys is not None:
+            self.cache.set_many('panoIds', {keys[i]: results[i] for i in pending if results[i] is not None})
+        return results
+
+    def _pano_ids_split(self, locations, batch, radius):
+        answer = self._pano_ids_request([locations[i] for i in batch], radius)
+        if answer is not None:
+            return list(zip(batch, answer))
+        if len(batch) == 1:
+            logger.warning("Error getting panorama IDs for point %s, %s", *locations[batch[0]])
+            return [(batch[0], None)]
+        middle = len(batch) // 2
+        return (self._pano_ids_split(locations, batch[:middle], radius)
+                + self._pano_ids_split(locations, batch[middle:], radius))
+
+    def _pano_ids_request(self, locations, radius):
+        url = f"{self.tile_url}/streetview/panoIds"
+        params = {'session': self.session_token, 'key': self.api_key}
+        payload = {"locations": [{"lat": lat, "lng": lng} for lat, lng in locations], "radius": radius}
+        response = self.request('POST', url, params=params, json=payload, headers=HEADERS)
+        if response is None or response.status_code != 200:
+            logger.debug("panoIds request for %d locations failed: %s", len(locations), _describe(response))
+            return None
+        pano_ids = response.json().get('panoIds', [])
+        if len(pano_ids) != len(locations):
+            logger.debug("panoIds returned %d IDs for %d locations", len(pano_ids), len(locations))
+            return None
+        return [[pano_id] if pano_id else [] for pano_id in pano_ids]
+
+    def panoramas_near(self, locations, radius=50, progress=None, should_stop=None):
+        """Return the panoramas near every ``(lat, lng)`` in ``locations``.
+
+        Pano IDs are gathered for the whole batch first and each distinct
+        pano is located once, however many points share it. The result holds
+        one list of ``(pano_id, lat, lng)`` per location (panoramas that
+        could not be located are dropped), or ``None`` where the pano ID
+        lookup failed. ``progress`` is called with ``(done, total)`` over
+        both passes, the locations followed by the distinct panoramas; until
+        those are known the total counts one panorama per location.
+        """
+        locations = list(locations)
+        pano_ids = self.panorama_ids_batch(locations, radius=radius, should_stop=should_stop,
+                                           progress=None if progress is None else
+                                           lambda done, total: progress(done, 2 * total))
+        unique = list(dict.fromkeys(pano_id for ids in pano_ids if ids for pano_id in ids))
+        report = None if progress is None else (
+            lambda done, total: progress(len(locations) + done, len(locations) + total))
+        located = dict(zip(unique, self.pano_locations(unique, progress=report, should_stop=should_stop)))
+        logger.info("Located %d distinct panoramas for %d points", len(unique), len(pano_ids))
+
+        results = []
+        for ids in pano_ids:
+            if ids is None:
+                results.append(None)
+                continue
+            results.append([(pano_id, *located[pano_id]) for pano_id in ids
+                            if located[pano_id][0] is not None and located[pano_id][1] is not None])
+        return results
+
+    def nearest_pano(self, lat, lng, radius=50):
+        """Return the metadata of the panorama nearest to ``lat``/``lng``.
+
+        The result is the decoded JSON body (its ``status`` is ``'OK'`` when
+        a panorama was found), or ``None`` when the request itself failed.
+        """
+        key = self.cache.location_key(lat, lng, radius) if self.cache is not None else None
+        if key is not None:
+            cached = self.cache.get('location', key)
+            if cached is not None:
+                count(self.telemetry, 'cache_hits')
+                return cached
+
+        url = f"{self.streetview_url}/metadata"
+        params = {'location': f"{lat},{lng}", 'radius': radius, 'key': self.api_key}
+        response = self.request('GET', url, params=params)
+        if response is not None and response.status_code == 200:
+            data = response.json()
+            if key is not None and data.get('status') in ('OK', 'ZERO_RESULTS'):
+                self.cache.set('location', key, data)
+            return data
+        logger.warning("Failed to query API for location %s,%s", lat, lng)
+        return None
+
+    def nearest_panos(self, locations, progress=None, should_stop=None):
+        """Return :meth:`nearest_pano` for every ``(lat, lng)``, concurrently.
+
+        ``progress`` and ``should_stop`` are passed to :meth:`map`; locations
+        skipped after a stop get ``None``.
+        """
+        return self.map(lambda location: self.nearest_pano(*location), locations,
+                        progress=progress, should_stop=should_stop)
+
+    def image_url(self, pano_id, size, fov, heading, pitch):
+        """Return the Street View Static API URL for one image."""
+        return image_url(self.api_key, pano_id, size, fov, heading, pitch, base_url=self.streetview_url)
+
+    def download_image(self, url, file_path):
+        """Stream ``url`` into ``file_path``; return ``True`` on success."""
+        return fetch(self, DownloadJob(file_path, url, file_path))
+
+
+def _describe(response):
+    if response is None:
+        return "no response"
+    return f"{response.status_code} {response.text}"
+
+
+def get_session_token(api_key):
+    """Create a Map Tiles API street view session and return its token."""
+    with StreetViewClient(api_key) as client:
+        return client.get_session_token()
+
+
+def get_pano_location(api_key, pano_id):
+    """Return the ``(lat, lng)`` of a panorama, or ``(None, None)``."""
+    with StreetViewClient(api_key) as client:
+        return client.pano_location(pano_id)
+
+
+def get_panorama_ids(session_token, api_key, lat, lng, radius=50):
+    """Return the pano IDs near ``lat``/``lng``, or ``None`` on API error."""
+    with StreetViewClient(api_key) as client:
+        client.session_token = session_token
+        return client.panorama_ids(lat, lng, radius=radius)
+
+
+def get_nearest_pano(api_key, lat, lng):
+    """Return the metadata of the panorama nearest to ``lat``/``lng``."""
+    with StreetViewClient(api_key) as client:
+        return client.nearest_pano(lat, lng)
+
+
+def image_url(api_key, pano_id, size, fov, heading, pitch, base_url=STREETVIEW_URL):
+    """Return the Street View Static API URL for one image."""
+    return f"{base_url}?&pano={pano_id}&size={size}&fov={fov}&heading={heading}&pitch={pitch}&key={api_key}"
+
+
+def svi_folder_name(layer_name, size, fov):
+    """Return the image folder name used for a layer/size/fov combination."""
+    return f"{layer_name.split('_')[0]}_size{size}_fov{fov}"
+
+
+def svi_file_name(rowId, panoId, latINTP, lonINTP, indexL, indexR):
+    """Return the image file name, which encodes the row and its buildings."""
+    return f"SVI-{rowId}-{panoId}-{latINTP}-{lonINTP}-{indexL}-{indexR}.jpg"
+
+
+def parse_svi_file_name(name):
+    """Return the fields encoded by :func:`svi_file_name` as strings, or ``None``.
+
+    The extension is optional. Pano IDs may contain ``-``; the coordinates
+    and building indexes are matched from the end of the name.
+    """
+    match = SVI_NAME.match(os.path.basename(name))
+    return match.groupdict() if match else None
+
+
+def download_image(url, file_path):
+    """Download ``url`` into ``file_path``; return ``True`` on success."""
+    with StreetViewClient(None) as client:
+        return client.download_image(url, file_path)
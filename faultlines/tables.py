@@ -0,0 +1,226 @@
+"""Columnar I/O for the STEP table intermediates.
+
+STEP tables (``STEP42.csv``, ``STEP43.csv``, ...) can be read and written as
+CSV, Parquet (``.parquet``) or Feather (``.feather``/``.arrow``), chosen by
+file extension. Known columns get explicit dtypes: angles and coordinates
+are ``float64``, while building indices and side labels are categorical, so
+they are neither re-parsed as floats nor stored once per row. ``columns``
+projections are pushed down to the Parquet/Feather readers, so a stage loads
+only the columns it needs.
+"""
+
+import os
+
+import numpy as np
+
+CHUNK_SIZE = 1_000_000
+PARQUET_COMPRESSION = "zstd"
+STEP_DTYPES = {
+    "rot1": "float64",
+    "rot2": "float64",
+    "rotation-s": "float64",
+    "intix1": "category",
+    "intix2": "category",
+    "index": "category",
+    "indexL": "category",
+    "indexR": "category",
+    "label1": "category",
+    "label2": "category",
+    "latINTP": "float64",
+    "lonINTP": "float64",
+    "lat": "float64",
+    "lon": "float64",
+    "heading": "float64",
+    "pitch": "float64",
+}
+
+
+def table_format(path):
+    """Return ``"csv"``, ``"parquet"`` or ``"feather"`` from the extension of ``path``."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".parquet", ".pq"):
+        return "parquet"
+    if extension in (".feather", ".arrow"):
+        return "feather"
+    if extension in (".csv", ".txt"):
+        return "csv"
+    raise ValueError(f"Unsupported table format: {path}")
+
+
+def _categorical(column):
+    import pandas as pd
+
+    if column.dtype == "category":
+        return column
+    if column.dtype == object:
+        try:
+            column = pd.to_numeric(column)
+        except (TypeError, ValueError):
+            pass
+    if column.dtype.kind == "f":
+        values = column.to_numpy()
+        valid = values[~np.isnan(values)]
+        # Indices read back from CSV with missing values parse as floats.
+        if np.array_equal(valid, np.round(valid)):
+            column = column.astype("Int64")
+    return column.astype("category")
+
+
+def apply_dtypes(frame, dtypes=None):
+    """Cast the columns of ``frame`` named in ``dtypes`` (default :data:`STEP_DTYPES`).
+
+    Categorical columns holding whole numbers get integer categories, so
+    ``12`` and ``12.0`` are one building.
+    """
+    dtypes = STEP_DTYPES if dtypes is None else dtypes
+    for name, dtype in dtypes.items():
+        if name not in frame.columns or frame[name].dtype == dtype:
+            continue
+        frame[name] = _categorical(frame[name]) if dtype == "category" else frame[name].astype(dtype)
+    return frame
+
+
+def _csv_options(columns, dtypes):
+    dtypes = STEP_DTYPES if dtypes is None else dtypes
+    # Categories are built after parsing so numeric indices stay numeric.
+    return {"usecols": columns, "dtype": {name: dtype for name, dtype in dtypes.items() if dtype != "category"}}
+
+
+def read_table(path, columns=None, dtypes=None):
+    """Read a whole STEP table as a DataFrame, loading only ``columns`` when given."""
+    import pandas as pd
+
+    kind = table_format(path)
+    if kind == "parquet":
+        frame = pd.read_parquet(path, columns=columns)
+    elif kind == "feather":
+        frame = pd.read_feather(path, columns=columns)
+    else:
+        frame = pd.read_csv(path, **_csv_options(columns, dtypes))
+    return apply_dtypes(frame, dtypes)
+
+
+def iter_table(path, columns=None, dtypes=None, chunk_size=CHUNK_SIZE):
+    """Yield a STEP table as DataFrames of at most ``chunk_size`` rows."""
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    kind = table_format(path)
+    if kind == "csv":
+        for chunk in pd.read_csv(path, chunksize=chunk_size, **_csv_options(columns, dtypes)):
+            yield apply_dtypes(chunk, dtypes)
+        return
+
+    if kind == "parquet":
+        batches = pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns)
+        for batch in batches:
+            yield apply_dtypes(batch.to_pandas(), dtypes)
+        return
+
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if columns is not None:
+                batch = batch.select(columns)
+            for start in range(0, batch.num_rows, chunk_size):
+                yield apply_dtypes(batch.slice(start, chunk_size).to_pandas(), dtypes)
+
+
+class TableWriter:
+    """Append DataFrame chunks to one CSV, Parquet or Feather file.
+
+    The schema of the first chunk is kept: categorical columns are written
+    as dictionaries with ``int32`` indices and later chunks are cast to the
+    first chunk's types. Every format is streamed to disk chunk by chunk. A
+    Feather file cannot replace a column's dictionary, so each chunk is
+    re-encoded against one growing dictionary per column and only the new
+    categories are written, as dictionary deltas. Use as a context manager
+    so the file is finalized.
+    """
+
+    def __init__(self, path, dtypes=None, compression=PARQUET_COMPRESSION):
+        self.path = path
+        self.kind = table_format(path)
+        self.dtypes = dtypes
+        self.compression = compression
+        self.schema = None
+        self.writer = None
+        self.dictionaries = {}
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _arrow(self, frame):
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self.schema is None:
+            fields = [pa.field(field.name, pa.dictionary(pa.int32(), field.type.value_type))
+                      if pa.types.is_dictionary(field.type) else field for field in table.schema]
+            self.schema = pa.schema(fields, metadata=table.schema.metadata)
+        return table.cast(self.schema)
+
+    def write(self, frame):
+        """Append the DataFrame ``frame``."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        frame = apply_dtypes(frame, self.dtypes)
+        if self.kind == "csv":
+            frame.to_csv(self.path, index=False, mode="w" if self.rows == 0 else "a", header=self.rows == 0)
+        elif self.kind == "feather":
+            table = self._unify(self._arrow(frame))
+            if self.writer is None:
+                options = pa.ipc.IpcWriteOptions(compression=self.compression, emit_dictionary_deltas=True)
+                self.writer = pa.ipc.new_file(self.path, self.schema, options=options)
+            self.writer.write_table(table)
+        else:
+            table = self._arrow(frame)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, self.schema, compression=self.compression)
+            self.writer.write_table(table)
+        self.rows += len(frame)
+
+    def _unify(self, table):
+        # Re-encode dictionary columns against the categories written so far, extended by the new ones.
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        for i, field in enumerate(table.schema):
+            if not pa.types.is_dictionary(field.type):
+                continue
+            column = table.column(i).combine_chunks() if table.num_rows else pa.array([], type=field.type)
+            known = self.dictionaries.get(field.name, pa.array([], type=field.type.value_type))
+            new = pc.filter(column.dictionary, pc.invert(pc.is_in(column.dictionary, value_set=known)))
+            dictionary = pa.concat_arrays([known, new])
+            positions = pc.index_in(column.dictionary, value_set=dictionary).cast(pa.int32())
+            indices = pc.take(positions, column.indices)
+            table = table.set_column(i, field, pa.DictionaryArray.from_arrays(indices, dictionary))
+            self.dictionaries[field.name] = dictionary
+        return table
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def write_table(frame, path, dtypes=None, compression=PARQUET_COMPRESSION):
+    """Write the DataFrame ``frame`` to ``path`` in the format of its extension."""
+    with TableWriter(path, dtypes=dtypes, compression=compression) as writer:
+        writer.write(frame)
+
+
+def convert_table(source, target, columns=None, dtypes=None, chunk_size=CHUNK_SIZE):
+    """Copy a STEP table between formats, ``chunk_size`` rows at a time; return the row count."""
+    with TableWriter(target, dtypes=dtypes) as writer:
+        for chunk in iter_table(source, columns=columns, dtypes=dtypes, chunk_size=chunk_size):
+            writer.write(chunk)
+    return writer.rows
+
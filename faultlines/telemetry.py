@@ -0,0 +1,163 @@
+"""Throttled progress reporting and per-stage counters and timers.
+
+:class:`Throttle` wraps a progress callback so the UI is updated at most
+every ``interval`` seconds (or every ``every`` items) instead of once per
+feature. :class:`Telemetry` collects named counters (features processed,
+API calls, cache hits, bytes downloaded, ...) and wall/CPU time per stage,
+and exports them as JSON or Prometheus text for run dashboards. Counters
+may be incremented from worker threads.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+TELEMETRY_ENV = "FAULTLINES_TELEMETRY"
+PROGRESS_INTERVAL = 0.5
+METRIC_PREFIX = "faultlines"
+
+
+class Throttle:
+    """Progress callback that forwards at most every ``interval`` seconds.
+
+    Call it as ``throttle(done, total)``; the wrapped ``callback`` receives
+    the same arguments. With ``every``, an update is also forwarded once
+    ``every`` more items are done. The first and the final (``done ==
+    total``) updates are always forwarded.
+    """
+
+    def __init__(self, callback, interval=PROGRESS_INTERVAL, every=None, clock=time.monotonic):
+        self.callback = callback
+        self.interval = interval
+        self.every = every
+        self.clock = clock
+        self.last_time = None
+        self.last_done = None
+        self.lock = threading.Lock()
+
+    def __call__(self, done, total=None):
+        with self.lock:
+            now = self.clock()
+            due = (self.last_time is None or (total is not None and done >= total)
+                   or (self.interval is not None and now - self.last_time >= self.interval)
+                   or (self.every is not None and done - self.last_done >= self.every))
+            if not due:
+                return
+            self.last_time, self.last_done = now, done
+        self.callback(done, total)
+
+
+class Telemetry:
+    """Counters and wall/CPU timers grouped by stage.
+
+    Counters incremented while a :meth:`stage` block is open are attributed
+    to that stage, others to ``""``. CPU time is the process CPU time, so it
+    includes worker threads.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self.current = ""
+        self.counters = {}
+        self.timers = {}
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def count(self, name, n=1, stage=None):
+        """Add ``n`` to counter ``name`` of ``stage`` (default: the open stage)."""
+        key = (self.current if stage is None else stage, name)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as stage ``name``; stages may repeat and accumulate."""
+        previous, self.current = self.current, name
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield self
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            with self.lock:
+                timer = self.timers.setdefault(name, {"runs": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+                timer["runs"] += 1
+                timer["wall_seconds"] += wall
+                timer["cpu_seconds"] += cpu
+            self.current = previous
+
+    def stages(self):
+        """Return ``{stage: {"runs", "wall_seconds", "cpu_seconds", "counters"}}``."""
+        with self.lock:
+            result = {name: dict(timer, counters={}) for name, timer in self.timers.items()}
+            for (stage, name), value in self.counters.items():
+                result.setdefault(stage, {"runs": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "counters": {}})
+                result[stage]["counters"][name] = value
+        return result
+
+    def to_dict(self):
+        return {"name": self.name, "started": self.started, "stages": self.stages()}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, sort_keys=True)
+
+    def to_prometheus(self, prefix=METRIC_PREFIX):
+        """Return the metrics in the Prometheus text exposition format."""
+        lines = []
+        labels = f'run="{_escape(self.name)}",' if self.name else ""
+        stages = self.stages()
+        for metric, help_text in (("wall_seconds", "Wall-clock time spent in the stage."),
+                                  ("cpu_seconds", "Process CPU time spent in the stage."),
+                                  ("runs", "Times the stage was entered.")):
+            name = f"{prefix}_stage_{metric}" + ("_total" if metric == "runs" else "")
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {'counter' if metric == 'runs' else 'gauge'}")
+            for stage, data in sorted(stages.items()):
+                if data["runs"]:
+                    lines.append(f'{name}{{{labels}stage="{_escape(stage)}"}} {data[metric]:g}')
+        names = sorted({counter for data in stages.values() for counter in data["counters"]})
+        for counter in names:
+            name = f"{prefix}_{_metric_name(counter)}_total"
+            lines.append(f"# TYPE {name} counter")
+            for stage, data in sorted(stages.items()):
+                if counter in data["counters"]:
+                    lines.append(f'{name}{{{labels}stage="{_escape(stage)}"}} {data["counters"][counter]:g}')
+        return "\n".join(lines) + "\n"
+
+    def save(self, path=None):
+        """Write the metrics to ``path`` (Prometheus text for ``.prom``/``.txt``, else JSON).
+
+        ``path`` defaults to ``$FAULTLINES_TELEMETRY``; nothing is written
+        when neither is set. Returns the path written, or ``None``.
+        """
+        path = path or os.environ.get(TELEMETRY_ENV)
+        if not path:
+            return None
+        text = self.to_prometheus() if os.path.splitext(path)[1].lower() in (".prom", ".txt") else self.to_json()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        part = f"{path}.part"
+        with open(part, "w") as file:
+            file.write(text)
+        os.replace(part, path)
+        return path
+
+    def summary(self):
+        """Return a one-line ``stage 1.2s (cpu 0.8s)`` summary of the timed stages."""
+        return ", ".join(f"{name} {data['wall_seconds']:.1f}s (cpu {data['cpu_seconds']:.1f}s)"
+                         for name, data in self.stages().items() if data["runs"])
+
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def count(telemetry, name, n=1):
+    """Increment ``name`` on ``telemetry`` when it is not ``None``."""
+    if telemetry is not None:
+        telemetry.count(name, n)
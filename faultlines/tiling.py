@@ -0,0 +1,158 @@
+"""Tiled multi-process execution of the geometry stages.
+
+The layer extent is cut into a grid of tiles. Every footprint (or point) is
+owned by the tile holding its bounding-box centre; a tile task also receives
+a halo of every geometry within ``tolerance`` of what it owns, so results
+are exact. Only results whose owner is the tile are kept, which removes the
+duplicates found in neighbouring halos without a separate merge pass.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import shapely
+
+from .adjacency import adjacency_pairs
+from .graph import from_pairs, shared_lengths
+from .indexing import assign_lr_index
+
+TILES_PER_WORKER = 4
+
+
+def tile_grid(bounds, count):
+    """Return ``(nx, ny, xmin, ymin, width, height)`` for about ``count`` tiles over ``bounds``."""
+    xmin, ymin, xmax, ymax = bounds
+    dx = max(xmax - xmin, 1e-9)
+    dy = max(ymax - ymin, 1e-9)
+    nx = max(1, int(round(np.sqrt(count * dx / dy))))
+    ny = max(1, int(np.ceil(count / nx)))
+    return nx, ny, xmin, ymin, dx / nx, dy / ny
+
+
+def tile_ids(xy, grid):
+    """Return the tile number owning each ``xy`` coordinate."""
+    nx, ny, xmin, ymin, width, height = grid
+    col = np.clip(((xy[:, 0] - xmin) // width).astype(np.int64), 0, nx - 1)
+    row = np.clip(((xy[:, 1] - ymin) // height).astype(np.int64), 0, ny - 1)
+    return row * nx + col
+
+
+def partition(geoms, tolerance, count):
+    """Split ``geoms`` into tiles.
+
+    Yields ``(owned, local)`` position arrays per non-empty tile: ``owned``
+    are the geometries the tile is responsible for and ``local`` every
+    geometry within ``tolerance`` of them (``owned`` included), sorted.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    # Empty geometries have NaN bounds and cannot be placed on the grid.
+    present = np.flatnonzero(~(shapely.is_missing(geoms) | shapely.is_empty(geoms)))
+    if len(present) == 0:
+        return
+    bounds = shapely.bounds(geoms[present])
+    centres = (bounds[:, :2] + bounds[:, 2:]) / 2
+    extent = (bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max())
+    owner = tile_ids(centres, tile_grid(extent, count))
+    tree = shapely.STRtree(geoms)
+
+    order = np.argsort(owner, kind="stable")
+    starts = np.flatnonzero(np.r_[True, owner[order][1:] != owner[order][:-1]])
+    for members in np.split(order, starts[1:]):
+        owned = present[members]
+        b = bounds[members]
+        halo = shapely.box(b[:, 0].min() - tolerance, b[:, 1].min() - tolerance,
+                           b[:, 2].max() + tolerance, b[:, 3].max() + tolerance)
+        yield owned, np.sort(tree.query(halo))
+
+
+def _run(tasks, function, workers):
+    if workers == 1:
+        return [function(*task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(function, *zip(*tasks))) if tasks else []
+
+
+def _tile_pairs(geoms, owned, local, tolerance, with_lengths):
+    left, right = adjacency_pairs(geoms, tolerance)
+    keep = np.isin(local[left], owned)
+    left, right = left[keep], right[keep]
+    lengths = None
+    if with_lengths:
+        lengths = np.stack([shared_lengths(geoms, left, right, tolerance),
+                            shared_lengths(geoms, right, left, tolerance)], axis=1)
+    return local[left], local[right], lengths
+
+
+def tiled_adjacency_pairs(geoms, tolerance, workers=None, tiles=None, with_lengths=False):
+    """Return the same pairs as :func:`~faultlines.adjacency.adjacency_pairs` using a process pool.
+
+    ``workers`` defaults to the CPU count and ``tiles`` to
+    ``TILES_PER_WORKER`` tiles per worker. With ``with_lengths`` a third
+    array holds the shared-wall length of every pair, measured on ``left``.
+    """
+    result = _tiled_pairs(geoms, tolerance, workers, tiles, with_lengths)
+    return result if not with_lengths else (result[0], result[1], result[2][:, 0])
+
+
+def _tiled_pairs(geoms, tolerance, workers, tiles, with_lengths):
+    # With with_lengths, the lengths are an (n, 2) array measured on left and on right.
+    geoms = np.asarray(geoms, dtype=object)
+    workers = workers or os.cpu_count()
+    tasks = [(geoms[local], owned, local, tolerance, with_lengths)
+             for owned, local in partition(geoms, tolerance, tiles or workers * TILES_PER_WORKER)]
+    results = _run(tasks, _tile_pairs, workers)
+
+    left = np.concatenate([r[0] for r in results] or [np.empty(0, dtype=np.int64)])
+    right = np.concatenate([r[1] for r in results] or [np.empty(0, dtype=np.int64)])
+    order = np.lexsort((right, left))
+    if not with_lengths:
+        return left[order], right[order]
+    lengths = np.concatenate([r[2] for r in results] or [np.empty((0, 2))])
+    return left[order], right[order], lengths[order]
+
+
+def tiled_adjacency_graph(geoms, tolerance, labels=None, workers=None, tiles=None):
+    """Tiled counterpart of :func:`~faultlines.graph.build_adjacency_graph`."""
+    left, right, lengths = _tiled_pairs(geoms, tolerance, workers, tiles, with_lengths=True)
+    return from_pairs(left, right, len(geoms), labels=labels, lengths=lengths[:, 0], reverse_lengths=lengths[:, 1])
+
+
+def _tile_index(points, buildings, labels, tolerance):
+    return assign_lr_index(points, buildings, labels, tolerance=tolerance)
+
+
+def tiled_assign_lr_index(points, buildings, labels, tolerance=10, workers=None, tiles=None):
+    """Return the same result as :func:`~faultlines.indexing.assign_lr_index` using a process pool.
+
+    Points are tiled by location; every tile receives the buildings whose
+    bounding box meets its points' extent grown by ``tolerance``.
+    """
+    points = np.asarray(points, dtype=object)
+    buildings = np.asarray(buildings, dtype=object)
+    labels = np.asarray(labels, dtype=object)
+    workers = workers or os.cpu_count()
+
+    index_left = np.full(len(points), None, dtype=object)
+    index_right = np.full(len(points), None, dtype=object)
+    valid = np.flatnonzero(~(shapely.is_missing(points) | shapely.is_empty(points)))
+    if len(valid) == 0:
+        return index_left, index_right
+
+    tree = shapely.STRtree(buildings)
+    groups, tasks = [], []
+    xy = shapely.get_coordinates(points[valid])
+    grid = tile_grid((*xy.min(axis=0), *xy.max(axis=0)), tiles or workers * TILES_PER_WORKER)
+    owner = tile_ids(xy, grid)
+    for tile in np.unique(owner):
+        rows = valid[owner == tile]
+        lo = xy[owner == tile].min(axis=0) - tolerance
+        hi = xy[owner == tile].max(axis=0) + tolerance
+        local = np.sort(tree.query(shapely.box(lo[0], lo[1], hi[0], hi[1])))
+        groups.append(rows)
+        tasks.append((points[rows], buildings[local], labels[local], tolerance))
+
+    for rows, (left, right) in zip(groups, _run(tasks, _tile_index, workers)):
+        index_left[rows] = left
+        index_right[rows] = right
+    return index_left, index_right
@@ -0,0 +1,197 @@
+"""Party-wall extraction.
+
+Builds the ``*_Vertices_Intersections`` points consumed by
+:func:`faultlines.indexing.assign_lr_index` straight from the building
+footprints: for every adjacent pair the shared wall is cut out of the
+footprint boundary and its street-facing end becomes an intersection point.
+The wall is clipped to the stretch that runs along the neighbour, so its
+ends are the real wall corners and not points ``tolerance`` into the
+facades.
+All geometry operations run once over the arrays of pairs.
+"""
+
+import numpy as np
+import shapely
+
+from .adjacency import CHUNK_SIZE, adjacency_pairs
+
+# Lengths below this (in layer units) are rounding noise, not wall.
+EDGE_EPSILON = 1e-9
+# Neighbour edges within 30 degrees of a footprint edge can share a wall with it.
+PARALLEL_SLOPE = np.tan(np.radians(30))
+
+
+def shared_walls(geoms, left, right, tolerance, chunk_size=CHUNK_SIZE):
+    """Return the part of ``left``'s boundary that runs along ``right``, per pair.
+
+    Each edge of ``left`` near ``right`` is clipped to the span of the
+    roughly parallel edges of ``right`` within ``tolerance`` of it,
+    projected onto the edge. The front and back facades only meet the
+    neighbour at the wall corner, so they are clipped to nothing and the
+    wall ends at the real corners.
+    Pairs without a shared wall get an empty geometry. The clipping is plain
+    array arithmetic over the edges, ``chunk_size`` pairs at a time.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    left = np.asarray(left, dtype=np.int64)
+    right = np.asarray(right, dtype=np.int64)
+    walls = np.full(len(left), shapely.from_wkt("LINESTRING EMPTY"), dtype=object)
+    if len(left) == 0:
+        return walls
+
+    nodes, inverse = np.unique(np.concatenate([left, right]), return_inverse=True)
+    edges = _edges(geoms[nodes])
+    bounds = shapely.bounds(geoms[nodes])
+    for first in range(0, len(left), chunk_size):
+        last = min(first + chunk_size, len(left))
+        pair, start, end, low, high = _clip_edges(edges, bounds, inverse[first:last],
+                                                  inverse[len(left) + first:len(left) + last], tolerance)
+        keep = high - low > EDGE_EPSILON
+        if not keep.any():
+            continue
+        direction = (end - start)[keep] / np.hypot(*(end - start)[keep].T)[:, None]
+        pieces = shapely.linestrings(np.stack([start[keep] + direction * low[keep, None],
+                                               start[keep] + direction * high[keep, None]], axis=1))
+        pairs, group = np.unique(pair[keep], return_inverse=True)
+        walls[first + pairs] = shapely.line_merge(shapely.multilinestrings(pieces, indices=group))
+    return walls
+
+
+def _edges(geoms):
+    # Every boundary edge as (start, end) coordinates, grouped by geometry with CSR offsets.
+    parts, owner = shapely.get_parts(shapely.boundary(geoms), return_index=True)
+    coords, part = shapely.get_coordinates(parts, return_index=True)
+    edge = np.flatnonzero(part[1:] == part[:-1])
+    offsets = np.zeros(len(geoms) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owner[part[edge]], minlength=len(geoms)), out=offsets[1:])
+    return coords[edge], coords[edge + 1], offsets
+
+
+def _expand(offsets, items):
+    # Repeat each row once per edge of items[row]; return the rows and those edges.
+    counts = offsets[items + 1] - offsets[items]
+    rows = np.repeat(np.arange(len(items)), counts)
+    return rows, np.repeat(offsets[items] - np.cumsum(counts) + counts, counts) + np.arange(len(rows))
+
+
+def _clip_edges(edges, bounds, lnode, rnode, tolerance):
+    """Clip the edges of ``lnode`` to the span of ``rnode`` within ``tolerance`` along them.
+
+    Returns ``(pair, start, end, low, high)``: every candidate edge of the
+    left footprints with the span ``[low, high]`` (distances from ``start``)
+    covered by its neighbour; ``high <= low`` when nothing is.
+    """
+    starts, ends, offsets = edges
+    pair, edge = _expand(offsets, lnode)
+    start, end = starts[edge], ends[edge]
+    # Only edges whose grown bounding box meets the neighbour's can run along it.
+    box = bounds[rnode[pair]]
+    near = ((np.minimum(start[:, 0], end[:, 0]) - tolerance <= box[:, 2])
+            & (np.maximum(start[:, 0], end[:, 0]) + tolerance >= box[:, 0])
+            & (np.minimum(start[:, 1], end[:, 1]) - tolerance <= box[:, 3])
+            & (np.maximum(start[:, 1], end[:, 1]) + tolerance >= box[:, 1]))
+    pair, start, end = pair[near], start[near], end[near]
+    length = np.hypot(*(end - start).T)
+    direction = (end - start) / np.where(length > 0, length, 1)[:, None]
+
+    # Neighbour edges in the frame of each candidate: u along it, v across.
+    candidate, other = _expand(offsets, rnode[pair])
+    d = direction[candidate]
+    p = starts[other] - start[candidate]
+    q = ends[other] - start[candidate]
+    u0, u1 = np.einsum("ij,ij->i", p, d), np.einsum("ij,ij->i", q, d)
+    v0, v1 = p[:, 1] * d[:, 0] - p[:, 0] * d[:, 1], q[:, 1] * d[:, 0] - q[:, 0] * d[:, 1]
+
+    # Keep the stretch of each neighbour edge with |v| <= tolerance.
+    width = tolerance + EDGE_EPSILON
+    dv = v1 - v0
+    flat = dv == 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t0, t1 = (-width - v0) / dv, (width - v0) / dv
+    t_min = np.where(flat, np.where(np.abs(v0) <= width, 0.0, np.inf), np.maximum(np.minimum(t0, t1), 0.0))
+    t_max = np.where(flat, 1.0, np.minimum(np.maximum(t0, t1), 1.0))
+    # Only neighbour edges roughly parallel to the candidate face it; this
+    # drops the neighbour's facades near a slanted facade of ``left``.
+    parallel = np.abs(dv) <= PARALLEL_SLOPE * np.abs(u1 - u0)
+    inside = (t_min <= t_max) & parallel
+    ua = (u0 + (u1 - u0) * t_min)[inside]
+    ub = (u0 + (u1 - u0) * t_max)[inside]
+
+    low = np.full(len(pair), np.inf)
+    high = np.full(len(pair), -np.inf)
+    np.minimum.at(low, candidate[inside], np.minimum(ua, ub))
+    np.maximum.at(high, candidate[inside], np.maximum(ua, ub))
+    return pair, start, end, np.clip(low, 0, length), np.clip(high, 0, length)
+
+
+def party_walls(geoms, tolerance, graph=None):
+    """Return ``(left, right, walls)`` for every adjacent footprint pair.
+
+    ``walls`` holds the part of ``left``'s boundary running along ``right``
+    (see :func:`shared_walls`). Pass an
+    :class:`~faultlines.graph.AdjacencyGraph` built with the same tolerance
+    as ``graph`` to reuse its pairs.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    left, right = graph.pairs() if graph is not None else adjacency_pairs(geoms, tolerance)
+    walls = shared_walls(geoms, left, right, tolerance)
+    keep = shapely.length(walls) > 0
+    return left[keep], right[keep], walls[keep]
+
+
+def wall_endpoints(walls):
+    """Return ``(start, end)`` point arrays at the two extremities of each wall.
+
+    The extremities are the wall vertices furthest apart along the wall's
+    dominant axis, which also holds for walls split into several parts.
+    """
+    coords, owner = shapely.get_coordinates(walls, return_index=True)
+    if len(coords) == 0:
+        empty = np.empty(0, dtype=object)
+        return empty, empty
+
+    bounds = shapely.bounds(walls)
+    along_x = (bounds[:, 2] - bounds[:, 0]) >= (bounds[:, 3] - bounds[:, 1])
+    key = np.where(along_x[owner], coords[:, 0], coords[:, 1])
+    order = np.lexsort((key, owner))
+    starts = np.searchsorted(owner[order], np.arange(len(walls)))
+    ends = np.r_[starts[1:], len(order)] - 1
+
+    first = coords[order[starts]]
+    last = coords[order[ends]]
+    return shapely.points(first), shapely.points(last)
+
+
+def party_wall_points(geoms, tolerance, streets=None, graph=None):
+    """Return the intersection points of every party wall as columns.
+
+    With ``streets`` (line geometries) only the wall end nearest to a street
+    is kept; otherwise both ends are returned. The result maps ``points``,
+    ``left``/``right`` (footprint positions of the pair), ``end`` (0 or 1)
+    and ``length`` (wall length) to aligned arrays.
+    """
+    left, right, walls = party_walls(geoms, tolerance, graph=graph)
+    start, end = wall_endpoints(walls)
+    length = shapely.length(walls)
+
+    if streets is not None and len(walls):
+        street_tree = shapely.STRtree(np.asarray(streets, dtype=object))
+        (_, _), d_start = street_tree.query_nearest(start, return_distance=True, all_matches=False)
+        (_, _), d_end = street_tree.query_nearest(end, return_distance=True, all_matches=False)
+        use_end = d_end < d_start
+        return {
+            "points": np.where(use_end, end, start),
+            "left": left,
+            "right": right,
+            "end": use_end.astype(np.int8),
+            "length": length,
+        }
+
+    n = len(walls)
+    return {
+        "points": np.concatenate([start, end]),
+        "left": np.concatenate([left, left]),
+        "right": np.concatenate([right, right]),
+        "end": np.repeat(np.array([0, 1], dtype=np.int8), n),
+        "length": np.concatenate([length, length]),
+    }
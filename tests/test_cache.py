@@ -0,0 +1,31 @@
+import sqlite3
+
+import pytest
+
+from faultlines.cache import QUERY_BATCH, MetadataCache
+
+
+def test_get_many_counts_hits_and_misses():
+    with MetadataCache(":memory:") as cache:
+        keys = [str(i) for i in range(QUERY_BATCH + 10)]
+        cache.set_many("pano", {key: {"i": int(key)} for key in keys[::2]})
+        found = cache.get_many("pano", keys + ["missing"])
+        assert found == {key: {"i": int(key)} for key in keys[::2]}
+        assert cache.stats() == {"hits": len(found), "misses": len(keys) + 1 - len(found),
+                                 "evictions": 0, "entries": len(found)}
+
+
+def test_get_many_drops_expired_entries():
+    with MetadataCache(":memory:", ttl=-1) as cache:
+        cache.set_many("pano", {"a": 1, "b": 2})
+        assert cache.get_many("pano", ["a", "b"]) == {}
+        assert cache.stats()["entries"] == 0
+
+
+def test_set_many_rolls_back_on_error():
+    with MetadataCache(":memory:") as cache:
+        with pytest.raises(sqlite3.Error):
+            cache.set_many("pano", {"a": 1, ("not", "bindable"): 2})
+        assert cache.stats()["entries"] == 0
+        cache.set_many("pano", {"a": 1})
+        assert cache.get("pano", "a") == 1
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+torch = pytest.importorskip("torch")
+
+from faultlines.depth import TensorProcessor, make_loader, predict  # noqa: E402
+
+
+class MeanDepth(torch.nn.Module):
+    """Predicts the mean of the colour channels, so the depth map is the image."""
+
+    class Output:
+        def __init__(self, predicted_depth):
+            self.predicted_depth = predicted_depth
+
+    def forward(self, pixel_values):
+        return self.Output(pixel_values.mean(dim=1))
+
+
+def test_mixed_image_sizes_are_padded_and_cropped(tmp_path):
+    rng = np.random.default_rng(0)
+    images = {}
+    for name, shape in (("a", (24, 32)), ("b", (40, 16)), ("c", (24, 32))):
+        pixels = rng.integers(0, 255, (*shape, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(tmp_path / f"{name}.png")
+        images[name] = pixels.astype(np.float32).mean(axis=2) / 255
+
+    loader = make_loader(str(tmp_path), TensorProcessor(), batch_size=3, workers=0)
+    assert not loader.pin_memory
+    depths = dict(predict(MeanDepth(), loader))
+    assert sorted(depths) == ["a", "b", "c"]
+    for name, expected in images.items():
+        assert depths[name].shape == expected.shape
+        np.testing.assert_allclose(depths[name], expected, atol=1e-5)
@@ -0,0 +1,35 @@
+import numpy as np
+import shapely
+
+from faultlines.graph import build_adjacency_graph, shared_lengths
+from faultlines.tiling import tiled_adjacency_graph
+
+
+def weights(graph):
+    return {(i, int(j)): length for i in range(len(graph))
+            for j, length in zip(graph.neighbors(i), graph.shared_lengths(i))}
+
+
+def test_edge_weights_are_the_wall_lengths():
+    # A touching box, a gapped box and a neighbour with a slanted facade.
+    geoms = [shapely.box(0, 0, 5, 10), shapely.box(5, 0, 10, 10), shapely.box(10.3, 2, 15, 8),
+             shapely.Polygon([(0, 10), (5, 10), (5, 20), (0.8, 20)])]
+    graph = build_adjacency_graph(geoms, 1.0)
+    stored = weights(graph)
+    assert stored[(0, 1)] == stored[(1, 0)] == 10
+    assert stored[(1, 2)] == stored[(2, 1)] == 6
+    assert stored[(0, 3)] == stored[(3, 0)] == 5
+
+    tiled = tiled_adjacency_graph(geoms, 1.0, workers=1, tiles=4)
+    np.testing.assert_array_equal(tiled.indices, graph.indices)
+    np.testing.assert_allclose(tiled.shared_length, graph.shared_length)
+
+
+def test_edge_weights_are_measured_on_each_footprint():
+    # The right footprint's wall leans away, leaving tolerance two thirds of the way up.
+    geoms = [shapely.box(0, 0, 5, 10), shapely.Polygon([(5, 0), (10, 0), (10, 10), (6.5, 10)])]
+    stored = weights(build_adjacency_graph(geoms, 1.0))
+    assert stored[(0, 1)] == shared_lengths(geoms, [0], [1], 1.0)[0]
+    assert stored[(1, 0)] == shared_lengths(geoms, [1], [0], 1.0)[0]
+    np.testing.assert_allclose(stored[(0, 1)], 10 / 1.5)
+    assert stored[(1, 0)] != stored[(0, 1)]
@@ -0,0 +1,21 @@
+import numpy as np
+import shapely
+
+from faultlines.graph import build_adjacency_graph, load_graph
+from faultlines.npz import mmap_member, save_npz
+
+
+def test_save_npz_keeps_the_given_name(tmp_path):
+    path = tmp_path / "arrays.bin"
+    assert save_npz(path, {"a": np.arange(5), "empty": np.empty(0)}) == path
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["arrays.bin"]
+    np.testing.assert_array_equal(mmap_member(path, "a"), np.arange(5))
+    assert mmap_member(path, "empty").shape == (0,)
+
+
+def test_graph_round_trip_without_npz_suffix(tmp_path):
+    geoms = shapely.box(np.arange(4) * 5.0, 0, np.arange(4) * 5.0 + 5, 5)
+    graph = build_adjacency_graph(geoms, 0.5, labels=np.array(["a", "b", "c", "d"], dtype=object))
+    path = graph.save(str(tmp_path / "block.graph"))
+    assert path == str(tmp_path / "block.graph")
+    assert list(load_graph(path).neighbor_labels("b")) == ["a", "c"]
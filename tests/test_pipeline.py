@@ -0,0 +1,78 @@
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import shapely
+from pyproj import CRS
+
+from faultlines import pipeline
+from faultlines.pipeline import FOOTPRINTS, Block, resolve_crs, run_block
+from faultlines.streetview import svi_folder_name
+
+
+def block(tmp_path, geo=True, crs=None):
+    """Write one footprint; ``geo`` adds GeoParquet metadata, without a ``crs`` key unless given."""
+    (tmp_path / "b").mkdir()
+    table = pa.table({"geometry": shapely.to_wkb([shapely.box(0, 0, 10, 10)]), "index": ["a"]})
+    if geo:
+        column = {"encoding": "WKB"}
+        if crs is not None:
+            column["crs"] = CRS(crs).to_json_dict()
+        metadata = {"version": "1.0.0", "primary_column": "geometry", "columns": {"geometry": column}}
+        table = table.replace_schema_metadata({b"geo": json.dumps(metadata)})
+    pq.write_table(table, tmp_path / "b" / FOOTPRINTS)
+    return Block(str(tmp_path), "b")
+
+
+def test_crs_read_from_geoparquet(tmp_path):
+    assert resolve_crs(block(tmp_path, crs="EPSG:32618")) == "EPSG:32618"
+
+
+def test_crs_required_when_not_recorded(tmp_path):
+    footprints = block(tmp_path, geo=False)
+    with pytest.raises(ValueError, match="--crs"):
+        resolve_crs(footprints)
+    assert resolve_crs(footprints, "EPSG:32618") == "EPSG:32618"
+
+
+def test_geographic_crs_rejected(tmp_path):
+    # GeoParquet without a crs key means OGC:CRS84.
+    with pytest.raises(ValueError, match="geographic"):
+        resolve_crs(block(tmp_path))
+
+
+def test_geographic_override_rejected(tmp_path):
+    with pytest.raises(ValueError, match="geographic"):
+        resolve_crs(block(tmp_path, crs="EPSG:32618"), "EPSG:4326")
+
+
+def test_depth_is_fresh_on_second_run(tmp_path, monkeypatch):
+    torch = pytest.importorskip("torch")
+    from PIL import Image
+
+    from faultlines import depth
+
+    class MeanDepth(torch.nn.Module):
+        def forward(self, pixel_values):
+            return type("Output", (), {"predicted_depth": pixel_values.mean(dim=1)})()
+
+    def touch(stage):
+        def run(block, params):
+            for output in stage.outputs:
+                open(block.path(output), "w").close()
+            if stage.name == "download":
+                folder = block.path(svi_folder_name(block.name, params["size"], params["fov"]))
+                os.makedirs(folder, exist_ok=True)
+                Image.new("RGB", (8, 4)).save(os.path.join(folder, "SVI-1-p-40.0-73.0-a-b.jpg"))
+        return run
+
+    for stage in pipeline.STAGES:
+        if stage.name != "depth":
+            monkeypatch.setattr(stage, "run", touch(stage))
+    monkeypatch.setattr(depth, "load_dpt", lambda device="cpu": (MeanDepth(), depth.TensorProcessor()))
+
+    block(tmp_path, crs="EPSG:32618")
+    assert run_block(str(tmp_path), "b", targets=("depth",))["depth"] == "ran"
+    assert run_block(str(tmp_path), "b", targets=("depth",))["depth"] == "fresh"
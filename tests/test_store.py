@@ -0,0 +1,21 @@
+import os
+import time
+
+from faultlines.store import ImageStore, blob_key
+
+
+def test_gc_keeps_downloads_in_progress(tmp_path):
+    with ImageStore(str(tmp_path)) as store:
+        orphan = store.blob_path(blob_key("p", 0, 0, 90, "640x640"))
+        os.makedirs(os.path.dirname(orphan), exist_ok=True)
+        fresh, stale = f"{orphan}.part", store.blob_path(blob_key("q", 0, 0, 90, "640x640")) + ".part"
+        os.makedirs(os.path.dirname(stale), exist_ok=True)
+        for path in (orphan, fresh, stale):
+            open(path, "wb").close()
+        old = time.time() - 2 * 3600
+        os.utime(stale, (old, old))
+
+        assert store.gc(part_grace=3600) == 2
+        assert not os.path.exists(orphan)
+        assert os.path.exists(fresh)
+        assert not os.path.exists(stale)
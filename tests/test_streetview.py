@@ -0,0 +1,37 @@
+from faultlines.streetview import MAP_CHUNK, StreetViewClient
+
+
+def test_map_reports_progress_between_chunks():
+    with StreetViewClient("key", concurrency=2) as client:
+        updates = []
+        results = client.map(lambda x: x * 2, range(20), progress=lambda done, total: updates.append((done, total)))
+    chunk = 2 * MAP_CHUNK
+    assert results == [x * 2 for x in range(20)]
+    assert updates == [(min(done, 20), 20) for done in range(chunk, 20 + chunk, chunk)]
+
+
+def test_map_stops_between_chunks():
+    with StreetViewClient("key", concurrency=2) as client:
+        calls = []
+        results = client.map(calls.append, range(20), should_stop=lambda: len(calls) > 0, default="skipped")
+    assert len(calls) == 2 * MAP_CHUNK
+    assert results == [None] * len(calls) + ["skipped"] * (20 - len(calls))
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {"Retry-After": "0"}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_retried_responses_are_closed():
+    responses = [FakeResponse(503), FakeResponse(429), FakeResponse(200)]
+    with StreetViewClient("key", rate=None, retries=3) as client:
+        client.http.request = lambda method, url, **kwargs: responses.pop(0) if responses else None
+        sent = list(responses)
+        assert client.request("GET", "http://example.invalid", stream=True) is sent[2]
+    assert [response.closed for response in sent] == [True, True, False]
@@ -0,0 +1,26 @@
+import pandas as pd
+import pyarrow as pa
+
+from faultlines.tables import TableWriter, iter_table, read_table
+
+
+def chunks():
+    yield pd.DataFrame({"indexL": pd.Categorical([1, 2, None]), "label1": ["L", "R", "L"], "rot1": [1.0, 2, 3]})
+    yield pd.DataFrame({"indexL": pd.Categorical([3, 1, 5]), "label1": ["R", "X", "L"], "rot1": [4.0, 5, 6]})
+
+
+def test_feather_chunks_are_streamed_with_growing_dictionaries(tmp_path):
+    path = str(tmp_path / "out.feather")
+    with TableWriter(path) as writer:
+        for i, chunk in enumerate(chunks()):
+            writer.write(chunk)
+            assert writer.rows == 3 * (i + 1)
+
+    with pa.memory_map(path) as source:
+        assert pa.ipc.open_file(source).num_record_batches == 2
+    table = read_table(path)
+    expected = pd.concat(list(chunks()), ignore_index=True)
+    assert table["indexL"].astype("Int64").tolist() == expected["indexL"].astype("Int64").tolist()
+    assert table["label1"].tolist() == expected["label1"].tolist()
+    assert table["rot1"].tolist() == expected["rot1"].tolist()
+    assert sum(len(chunk) for chunk in iter_table(path, chunk_size=2)) == 6
@@ -0,0 +1,51 @@
+import numpy as np
+import shapely
+
+from faultlines.adjacency import adjacency_pairs
+from faultlines.graph import build_adjacency_graph
+from faultlines.indexing import assign_lr_index
+from faultlines.tiling import tiled_adjacency_graph, tiled_adjacency_pairs, tiled_assign_lr_index
+
+
+def footprints():
+    boxes = list(shapely.box(np.arange(12) * 5.0, 0, np.arange(12) * 5.0 + 5, 10))
+    boxes[3] = shapely.Polygon()
+    boxes[7] = None
+    boxes.append(shapely.Polygon())
+    return np.array(boxes, dtype=object)
+
+
+def test_tiled_pairs_skip_empty_and_missing_geometries():
+    geoms = footprints()
+    expected = adjacency_pairs(geoms, 0.5)
+    for workers in (1, 2):
+        left, right = tiled_adjacency_pairs(geoms, 0.5, workers=workers, tiles=4)
+        np.testing.assert_array_equal(left, expected[0])
+        np.testing.assert_array_equal(right, expected[1])
+
+
+def test_tiled_graph_matches_untiled():
+    geoms = footprints()
+    expected = build_adjacency_graph(geoms, 0.5)
+    graph = tiled_adjacency_graph(geoms, 0.5, workers=1, tiles=4)
+    np.testing.assert_array_equal(graph.offsets, expected.offsets)
+    np.testing.assert_array_equal(graph.indices, expected.indices)
+    np.testing.assert_allclose(graph.shared_length, expected.shared_length)
+
+
+def test_tiled_geometries_all_empty():
+    geoms = np.array([shapely.Polygon(), None, shapely.Polygon()], dtype=object)
+    left, right = tiled_adjacency_pairs(geoms, 0.5, workers=1)
+    assert len(left) == len(right) == 0
+    assert tiled_adjacency_graph(geoms, 0.5, workers=1).edge_count == 0
+
+
+def test_tiled_index_matches_untiled():
+    geoms = footprints()
+    labels = np.arange(len(geoms))
+    points = np.array([shapely.Point(5, 5), shapely.Point(), None, shapely.Point(50, 0), shapely.Point(30, 10)],
+                      dtype=object)
+    expected = assign_lr_index(points, geoms, labels, tolerance=2)
+    result = tiled_assign_lr_index(points, geoms, labels, tolerance=2, workers=1, tiles=3)
+    assert list(result[0]) == list(expected[0])
+    assert list(result[1]) == list(expected[1])
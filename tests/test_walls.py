@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+import shapely
+from shapely import affinity
+
+from faultlines.walls import party_wall_points, shared_walls
+
+
+@pytest.mark.parametrize("gap, tolerance", [(0, 0), (0, 1.0), (0.3, 1.0), (0.3, 0.5)])
+def test_wall_ends_at_the_corners(gap, tolerance):
+    geoms = [shapely.box(0, 0, 5, 10), shapely.box(5 + gap, 0, 10 + gap, 10)]
+    result = party_wall_points(geoms, tolerance)
+    assert sorted(shapely.get_coordinates(result["points"]).tolist()) == [[5, 0], [5, 10]]
+    np.testing.assert_allclose(result["length"], 10)
+
+
+def test_gap_wider_than_tolerance_has_no_wall():
+    geoms = [shapely.box(0, 0, 5, 10), shapely.box(5.3, 0, 10.3, 10)]
+    assert len(party_wall_points(geoms, 0.2)["points"]) == 0
+
+
+def test_partial_and_rotated_walls():
+    geoms = [shapely.box(0, 0, 5, 10), shapely.box(5, 2, 10, 8), shapely.box(5.2, 8, 10, 14)]
+    walls = shared_walls(geoms, [0, 0, 1], [1, 2, 2], 1.0)
+    assert [wall.normalize().wkt for wall in walls] == ["LINESTRING (5 2, 5 8)", "LINESTRING (5 8, 5 10)",
+                                                        "LINESTRING (5.2 8, 10 8)"]
+
+    rotated = affinity.rotate(shapely.GeometryCollection(geoms), 30, origin=(0, 0)).geoms
+    expected = affinity.rotate(shapely.LineString([(5, 2), (5, 8)]), 30, origin=(0, 0))
+    wall = shared_walls(list(rotated), [0], [1], 1.0)[0]
+    assert shapely.equals_exact(wall.normalize(), expected.normalize(), tolerance=1e-9)
+
+
+def test_slanted_facade_adds_no_stub():
+    geoms = [shapely.box(0, 0, 5, 10), shapely.Polygon([(0, 10), (5, 10), (5, 20), (0.8, 20)])]
+    walls = shared_walls(geoms, [1], [0], 1.0)
+    assert walls[0].normalize().wkt == "LINESTRING (0 10, 5 10)"